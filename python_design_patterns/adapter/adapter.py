@@ -62,11 +62,25 @@ class LineToPointAdapter(list):
         bottom = min(line.start.y, line.end.y)
 
         if right - left == 0:
-            for y in range(top, bottom):
+            for y in range(bottom, top):
                 self.append(Point(left, y))
         elif line.end.y - line.start.y == 0:
             for x in range(left, right):
                 self.append(Point(x, top))
+        else:
+            # Any other line: walk from the left end and round to the nearest pixel in every step.
+            start, end = sorted(
+                [(line.start.x, line.start.y), (line.end.x, line.end.y)]
+            )
+            dx, dy = end[0] - start[0], end[1] - start[1]
+            steps = max(abs(dx), abs(dy))
+            for i in range(steps):
+                self.append(
+                    Point(
+                        start[0] + (2 * i * dx + steps) // (2 * steps),
+                        start[1] + (2 * i * dy + steps) // (2 * steps),
+                    )
+                )
 
 
 if __name__ == "__main__":
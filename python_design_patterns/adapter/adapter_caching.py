@@ -1,7 +1,13 @@
 # The adapter design pattern
 # A construct which adapts and existing interface X to conform to the required interface Y.
 from __future__ import annotations
-from typing import List
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from python_design_patterns.adapter.bresenham import line_points
+
 
 # Let's construct the interface we have:
 class Point:
@@ -35,51 +41,126 @@ class Rectangle(list):
 # want to use the `draw_point` interface.
 # Let's build an adapter to create Points in a list.
 def draw(rectangles: List[Rectangle]):
-    for rectangle in rectangles:
-        for line in rectangle:
-            adapter = LineToPointAdapter(line)
-            for p in adapter:
-                draw_point(p)
+    lines = [line for rectangle in rectangles for line in rectangle]
+    for adapter in LineToPointAdapter.adapt_all(lines):
+        for p in adapter:
+            draw_point(p)
+
+
+# Generating the points of a line is the expensive part, so we only want to do it once for every line.
+# Two lines with the same endpoints have the same points, no matter which object they are or in which
+# direction they run, so the cache is keyed on the endpoint coordinates. To bound the memory used, it
+# keeps at most `max_points` points and evicts the least recently used lines first.
+# The points are stored as the integer arrays `line_points` computes, so many lines are generated at once
+# and a cached line only costs 16 bytes per point instead of a `Point` object.
+def line_key(line: Line):
+    start = (line.start.x, line.start.y)
+    end = (line.end.x, line.end.y)
+    return start + end if start <= end else end + start
+
+
+class PointCache:
+    def __init__(self, max_points: int = 1_000_000):
+        self.max_points = max_points
+        self.points = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lines = OrderedDict()
+
+    # Returns the points of the line as an (n, 2) array of x and y.
+    def get(self, line: Line) -> np.ndarray:
+        return self.get_many([line])[0]
+
+    # Generates the points of all lines missing from the cache in a single vectorized pass.
+    def get_many(self, lines: List[Line]) -> List[np.ndarray]:
+        keys = [line_key(line) for line in lines]
+        found = {}
+        for key in keys:
+            if key in found:
+                self.hits += 1
+            elif key in self._lines:
+                self.hits += 1
+                self._lines.move_to_end(key)
+                found[key] = self._lines[key]
+            else:
+                self.misses += 1
+                found[key] = None
+
+        missing = [key for key, points in found.items() if points is None]
+        if missing:
+            offsets, points = line_points(missing)
+            for key, start, end in zip(missing, offsets[:-1], offsets[1:]):
+                # Copied, so that evicting a line frees its memory even if other lines of the batch stay.
+                found[key] = points[start:end].copy()
+                self._add(key, found[key])
+        return [found[key] for key in keys]
+
+    def _add(self, key, points: np.ndarray):
+        # A line with more points than the whole budget is not cached at all.
+        if len(points) > self.max_points:
+            return
+        self._lines[key] = points
+        self.points += len(points)
+        while self.points > self.max_points:
+            _, evicted = self._lines.popitem(last=False)
+            self.points -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._lines.clear()
+        self.points = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __str__(self):
+        return (
+            f"PointCache(lines={len(self)}, points={self.points}/{self.max_points}, "
+            f"hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+        )
 
 
 # So this will be our adapter for line -> point
 class LineToPointAdapter:
-    count = 0
-    cache = {}
-
-    def __init__(self, line: Line):
-        super().__init__()
-        self.hash = hash(line)
-        if self.hash in self.cache:
-            return self.cache[self.hash]
-
-        print(
-            f"{self.count}: Generating poitns for line"
-            f"[{line.start.x}, {line.start.y}]->"
-            f"[{line.end.x}, {line.end.y}]"
-        )
+    cache = PointCache()
 
-        left = min(line.start.x, line.end.x)
-        right = max(line.start.x, line.end.x)
-        top = max(line.start.y, line.end.y)
-        bottom = min(line.start.y, line.end.y)
+    def __init__(self, line: Line, points: Optional[np.ndarray] = None):
+        self.points = self.cache.get(line) if points is None else points
 
-        points = []
-        if right - left == 0:
-            for y in range(top, bottom):
-                points.append(Point(left, y))
-        elif line.end.y - line.start.y == 0:
-            for x in range(left, right):
-                points.append(Point(x, top))
-        self.cache[self.hash] = points
+    @classmethod
+    def adapt_all(cls, lines: List[Line]) -> List[LineToPointAdapter]:
+        return [
+            cls(line, points) for line, points in zip(lines, cls.cache.get_many(lines))
+        ]
 
     def __iter__(self):
-        return iter(self.cache[self.hash])
+        for x, y in self.points.tolist():
+            yield Point(x, y)
+
+    def __len__(self):
+        return len(self.points)
 
 
 if __name__ == "__main__":
     rectangles = [Rectangle(1, 1, 10, 10), Rectangle(3, 3, 6, 6)]
     draw(rectangles)
+    print()
 
-# Nice where can we go from now?
-# We could optimize this because currently we build the same points over and over again.
\ No newline at end of file
+    # Identical rectangles share all their edges, so every distinct edge is generated only once.
+    LineToPointAdapter.cache.clear()
+    rectangles = [Rectangle(i % 10, 0, 100, 100) for i in range(10_000)]
+    for rectangle in rectangles:
+        for line in rectangle:
+            LineToPointAdapter(line)
+    assert LineToPointAdapter.cache.misses == 10 * 4
+    print(LineToPointAdapter.cache)
+
+    small = PointCache(max_points=150)
+    for rectangle in rectangles[:2]:
+        for line in rectangle:
+            small.get(line)
+    assert small.points <= 150 and small.evictions > 0
@@ -0,0 +1,133 @@
+# Points of arbitrary lines, for many lines at once.
+# A line from (x0, y0) to (x1, y1) takes `steps = max(|dx|, |dy|)` steps, and step i is at
+#     x0 + round(i * dx / steps), y0 + round(i * dy / steps)
+# which are the same pixels Bresenham's algorithm picks, but every point can be computed on its own.
+# Using integers only, round(a / b) is (2a + b) // (2b), so no floating point errors creep in.
+# That lets NumPy compute the points of all lines in one go: we repeat every line once per step, so
+# each element only has to know its line and its step.
+# As in the adapter, a line is always walked from its smaller endpoint (by x, then y) and its other
+# endpoint is not part of it, unless `include_end` is set.
+# Since both coordinates only ever move in one direction, the steps of a line that fall into a rectangle
+# are a single range, which `step_range` computes exactly by solving the rounding for i, just like
+# Liang-Barsky clipping solves for the parameter of a line.
+from __future__ import annotations
+from contextlib import redirect_stdout
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from python_design_patterns.adapter.adapter import Line, LineToPointAdapter, Point
+
+
+def normalize(coordinates) -> np.ndarray:
+    coordinates = np.asarray(coordinates, dtype=np.int64).reshape(-1, 4)
+    x0, y0, x1, y1 = coordinates.T
+    swap = (x1 < x0) | ((x1 == x0) & (y1 < y0))
+    return np.where(swap[:, None], coordinates[:, [2, 3, 0, 1]], coordinates)
+
+
+# Returns `offsets, points`: the points of line i are `points[offsets[i] : offsets[i + 1]]`.
+# If `first` and `last` are given, only the steps from `first[i]` to `last[i]` (inclusive) of line i are.
+def line_points(
+    coordinates,
+    include_end: bool = False,
+    first: Optional[np.ndarray] = None,
+    last: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    x0, y0, x1, y1 = normalize(coordinates).T
+    dx, dy = x1 - x0, y1 - y0
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    if first is None:
+        first = np.zeros_like(steps)
+        last = steps if include_end else steps - 1
+    first = np.asarray(first, dtype=np.int64)
+    counts = np.maximum(np.asarray(last, dtype=np.int64) - first + 1, 0)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    line = np.repeat(np.arange(len(counts)), counts)
+    step = np.arange(offsets[-1]) - offsets[line] + first[line]
+    divisor = 2 * np.maximum(steps[line], 1)
+    points = np.empty((offsets[-1], 2), dtype=np.int64)
+    points[:, 0] = x0[line] + (2 * step * dx[line] + divisor // 2) // divisor
+    points[:, 1] = y0[line] + (2 * step * dy[line] + divisor // 2) // divisor
+    return offsets, points
+
+
+# Returns `first, last`: the steps from `first[i]` to `last[i]` of line i, endpoints included, are the
+# ones inside the rectangle from `left, top` to `right, bottom` (inclusive), which can also be arrays
+# with a rectangle per line. The range is empty (`first > last`) if the line misses the rectangle.
+def step_range(coordinates, left, top, right, bottom) -> Tuple[np.ndarray, np.ndarray]:
+    x0, y0, x1, y1 = normalize(coordinates).T
+    dx, dy = x1 - x0, y1 - y0
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    first, last = np.zeros_like(steps), steps.copy()
+    for start, delta, low, high in ((x0, dx, left, right), (y0, dy, top, bottom)):
+        # The offset of step i is floor((2 * i * delta + steps) / (2 * steps)). It has to be at least
+        # `below` and at most `above`, which bounds i from one side each.
+        below, above = low - start, high - start
+        divisor = 2 * np.maximum(np.abs(delta), 1)
+        to_below = (steps - 2 * steps * below) // divisor
+        past_above = (steps - 2 * steps * (above + 1)) // divisor
+        rising, falling = delta > 0, delta < 0
+        np.maximum(first, np.where(rising, -to_below, 0), out=first)
+        np.minimum(last, np.where(rising, -past_above - 1, last), out=last)
+        np.maximum(first, np.where(falling, past_above + 1, 0), out=first)
+        np.minimum(last, np.where(falling, to_below, last), out=last)
+        # A coordinate that never changes is either always inside or never.
+        outside = (delta == 0) & ((below > 0) | (above < 0))
+        last[outside] = -1
+    return first, last
+
+
+def benchmark_line_points(count: int = 100_000):
+    generator = np.random.default_rng(0)
+    coordinates = generator.integers(0, 200, (count, 4))
+    lines = [
+        Line(Point(x0, y0), Point(x1, y1)) for x0, y0, x1, y1 in coordinates.tolist()
+    ]
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for line in lines[: count // 100]:
+            LineToPointAdapter(line)
+    adapter = (time.perf_counter() - start) * 100
+
+    start = time.perf_counter()
+    offsets, points = line_points(coordinates)
+    vectorized = time.perf_counter() - start
+    print(
+        f"{count} lines, {len(points)} points: LineToPointAdapter {adapter:.2f}s "
+        f"(extrapolated), line_points {vectorized * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    offsets, points = line_points([(0, 0, 4, 2), (3, 5, 3, 1), (7, 7, 7, 7)])
+    assert offsets.tolist() == [0, 4, 8, 8]
+    assert points[:4].tolist() == [[0, 0], [1, 1], [2, 1], [3, 2]]
+    assert points[4:].tolist() == [[3, 1], [3, 2], [3, 3], [3, 4]]
+
+    _, points = line_points([(4, 0, 0, 4)], include_end=True)
+    assert points.tolist() == [[0, 4], [1, 3], [2, 2], [3, 1], [4, 0]]
+
+    generator = np.random.default_rng(1)
+    coordinates = generator.integers(-20, 20, (500, 4))
+    offsets, points = line_points(coordinates)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for (x0, y0, x1, y1), start, end in zip(
+            coordinates.tolist(), offsets[:-1], offsets[1:]
+        ):
+            adapter = LineToPointAdapter(Line(Point(x0, y0), Point(x1, y1)))
+            assert [[p.x, p.y] for p in adapter] == points[start:end].tolist()
+
+    _, everything = line_points(coordinates, include_end=True)
+    for left, top, right, bottom in [(-5, -7, 6, 3), (0, 0, 0, 0), (10, -20, 30, 19)]:
+        first, last = step_range(coordinates, left, top, right, bottom)
+        offsets, points = line_points(coordinates, first=first, last=last)
+        x, y = everything.T
+        inside = (x >= left) & (x <= right) & (y >= top) & (y <= bottom)
+        assert points.tolist() == everything[inside].tolist()
+
+    benchmark_line_points()
@@ -0,0 +1,196 @@
+# Rasterizing lines into a NumPy framebuffer.
+# The adapter turns every line into `Point` objects and calls `draw_point` for each of them, so drawing
+# costs a Python object and a function call per pixel. If what we actually want is an image, we can
+# skip the points altogether and write the lines into a 2D array, which is then rendered in one go.
+# A single axis-aligned line is one slice assignment. For many lines, even a loop of slice assignments
+# is slow, so `draw_lines` handles all of them at once: every line adds +1 where it starts and -1 after
+# it ends to a row (or column) of a difference array, and a cumulative sum along the rows (or columns)
+# marks every pixel covered by at least one line. Any other lines are drawn point by point with the
+# vectorized `line_points`.
+# Unlike the adapter, lines include both of their endpoints, so the outline of a rectangle is closed.
+# Pixels outside the framebuffer are clipped.
+from __future__ import annotations
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from python_design_patterns.adapter.adapter import Line, Point, Rectangle
+from python_design_patterns.adapter.bresenham import line_points
+
+
+def line_coordinates(rectangles: List[Rectangle]) -> np.ndarray:
+    return np.array(
+        [
+            (line.start.x, line.start.y, line.end.x, line.end.y)
+            for rectangle in rectangles
+            for line in rectangle
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+
+
+def rectangle_coordinates(x, y, width, height) -> np.ndarray:
+    x, y, width, height = (
+        np.asarray(values, dtype=np.int64) for values in (x, y, width, height)
+    )
+    right, bottom = x + width, y + height
+    # The same four edges as `Rectangle`.
+    return np.stack(
+        [
+            np.stack([x, y, right, y], axis=1),
+            np.stack([right, y, right, bottom], axis=1),
+            np.stack([x, y, x, bottom], axis=1),
+            np.stack([x, bottom, right, bottom], axis=1),
+        ],
+        axis=1,
+    ).reshape(-1, 4)
+
+
+class Framebuffer:
+    # `pixels` can be an existing (height, width) uint8 array to draw into, e.g. a view of a larger image.
+    def __init__(self, width: int, height: int, pixels: Optional[np.ndarray] = None):
+        self.width = width
+        self.height = height
+        if pixels is None:
+            pixels = np.zeros((height, width), dtype=np.uint8)
+        self.pixels = pixels
+
+    def clear(self):
+        self.pixels[:] = 0
+
+    def draw_line(self, line: Line):
+        x0, x1 = sorted((line.start.x, line.end.x))
+        y0, y1 = sorted((line.start.y, line.end.y))
+        if y0 == y1 and 0 <= y0 < self.height:
+            self.pixels[y0, max(x0, 0) : max(x1 + 1, 0)] = 1
+        elif x0 == x1:
+            if 0 <= x0 < self.width:
+                self.pixels[max(y0, 0) : max(y1 + 1, 0), x0] = 1
+        else:
+            self._draw_points(
+                line_points(
+                    [(line.start.x, line.start.y, line.end.x, line.end.y)],
+                    include_end=True,
+                )[1]
+            )
+
+    # Draws all lines of an (n, 4) array of `x0, y0, x1, y1` rows.
+    def draw_lines(self, coordinates: np.ndarray):
+        coordinates = np.asarray(coordinates, dtype=np.int64).reshape(-1, 4)
+        x0, y0, x1, y1 = coordinates.T
+        horizontal = y0 == y1
+        vertical = (x0 == x1) & ~horizontal
+        diagonal = ~horizontal & ~vertical
+        if diagonal.any():
+            self._draw_points(line_points(coordinates[diagonal], include_end=True)[1])
+        self._draw_runs(
+            self.pixels,
+            y0[horizontal],
+            np.minimum(x0, x1)[horizontal],
+            np.maximum(x0, x1)[horizontal],
+        )
+        self._draw_runs(
+            self.pixels.T,
+            x0[vertical],
+            np.minimum(y0, y1)[vertical],
+            np.maximum(y0, y1)[vertical],
+        )
+
+    def draw(self, rectangles: List[Rectangle]):
+        self.draw_lines(line_coordinates(rectangles))
+
+    def _draw_points(self, points: np.ndarray):
+        x, y = points.T
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        self.pixels[y[inside], x[inside]] = 1
+
+    # Marks the pixels from `starts` to `ends` (inclusive) in the given rows of `target`.
+    @staticmethod
+    def _draw_runs(target: np.ndarray, rows, starts, ends):
+        height, width = target.shape
+        visible = (rows >= 0) & (rows < height) & (ends >= 0) & (starts < width)
+        rows = rows[visible]
+        starts = np.clip(starts[visible], 0, width)
+        ends = np.clip(ends[visible] + 1, 0, width)
+        if rows.size == 0:
+            return
+        stride = width + 1
+        size = height * stride
+        difference = np.bincount(rows * stride + starts, minlength=size)
+        difference -= np.bincount(rows * stride + ends, minlength=size)
+        covered = np.cumsum(difference.reshape(height, stride), axis=1)[:, :width] > 0
+        target |= covered
+
+    def to_bytes(self, on: bytes = b"*", off: bytes = b" ") -> bytes:
+        characters = np.array([off, on], dtype="S1")[self.pixels]
+        lines = np.hstack([characters, np.full((self.height, 1), b"\n", dtype="S1")])
+        return lines.tobytes()
+
+    def to_text(self, on: str = "*", off: str = " ") -> str:
+        return self.to_bytes(on.encode(), off.encode()).decode()
+
+    # A binary portable bitmap, which most image viewers can open.
+    def to_pbm(self) -> bytes:
+        header = f"P4\n{self.width} {self.height}\n".encode()
+        return header + np.packbits(self.pixels, axis=1).tobytes()
+
+
+def benchmark_framebuffer(count: int = 100_000, size: int = 2000):
+    generator = np.random.default_rng(0)
+    x, y = generator.integers(0, size, (2, count))
+    width, height = generator.integers(1, 200, (2, count))
+    rectangles = [
+        Rectangle(*values)
+        for values in zip(x.tolist(), y.tolist(), width.tolist(), height.tolist())
+    ]
+    framebuffer = Framebuffer(size, size)
+
+    start = time.perf_counter()
+    for rectangle in rectangles[:1000]:
+        for line in rectangle:
+            framebuffer.draw_line(line)
+    per_line = (time.perf_counter() - start) / 1000 * count
+    framebuffer.clear()
+
+    start = time.perf_counter()
+    framebuffer.draw(rectangles)
+    from_rectangles = time.perf_counter() - start
+    framebuffer.clear()
+
+    start = time.perf_counter()
+    framebuffer.draw_lines(rectangle_coordinates(x, y, width, height))
+    from_arrays = time.perf_counter() - start
+    start = time.perf_counter()
+    framebuffer.to_bytes()
+    rendered = time.perf_counter() - start
+    print(
+        f"{count} rectangles on {size}x{size}: slice per line {per_line:.2f}s (extrapolated), "
+        f"Rectangle objects {from_rectangles * 1000:.0f}ms, arrays {from_arrays * 1000:.0f}ms, "
+        f"to_bytes {rendered * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    framebuffer = Framebuffer(12, 12)
+    framebuffer.draw([Rectangle(1, 1, 10, 10), Rectangle(3, 3, 6, 6)])
+    print(framebuffer.to_text())
+
+    single = Framebuffer(12, 12)
+    for rectangle in [Rectangle(1, 1, 10, 10), Rectangle(3, 3, 6, 6)]:
+        for line in rectangle:
+            single.draw_line(line)
+    assert (single.pixels == framebuffer.pixels).all()
+
+    diagonal = Framebuffer(4, 3)
+    diagonal.draw_lines([(0, 2, 3, 0)])
+    assert diagonal.to_text(on="#", off=".") == "...#\n.##.\n#...\n"
+    single.clear()
+    single.draw_line(Line(Point(3, 0), Point(0, 2)))
+    assert (single.pixels[:3, :4] == diagonal.pixels).all()
+
+    clipped = Framebuffer(5, 5)
+    clipped.draw([Rectangle(-3, 2, 10, 10)])
+    assert clipped.to_text(on="#", off=".") == ".....\n.....\n#####\n.....\n.....\n"
+
+    benchmark_framebuffer()
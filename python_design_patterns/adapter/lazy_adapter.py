@@ -0,0 +1,107 @@
+# A lazy adapter from lines to points.
+# `LineToPointAdapter` creates every point of a line up front, so adapting a line of length n needs
+# memory for n points even though `draw` only looks at one point at a time. The points of a line are
+# as regular as the numbers in a `range`, so just like a `range` we can compute every point when it is
+# asked for. `LinePoints` is such a view: it supports `len`, indexing and iteration, and only ever holds
+# a single point, so drawing needs constant memory no matter how long the lines are.
+from __future__ import annotations
+from collections.abc import Sequence
+from contextlib import redirect_stdout
+import os
+import time
+import tracemalloc
+from typing import Callable, List
+
+from python_design_patterns.adapter.adapter import (
+    Line,
+    LineToPointAdapter,
+    Point,
+    Rectangle,
+    draw_point,
+)
+
+
+class LinePoints(Sequence):
+    def __init__(self, line: Line):
+        # Same points as `LineToPointAdapter`: walk from the left end, rounding to the nearest pixel.
+        start, end = sorted([(line.start.x, line.start.y), (line.end.x, line.end.y)])
+        self._x, self._y = start
+        self._dx, self._dy = end[0] - start[0], end[1] - start[1]
+        self._steps = max(abs(self._dx), abs(self._dy))
+
+    def __len__(self):
+        return self._steps
+
+    def __getitem__(self, index: int) -> Point:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._steps
+        if not 0 <= index < self._steps:
+            raise IndexError("LinePoints index out of range")
+        return self._point(index)
+
+    def __iter__(self):
+        # Axis-aligned lines, like the edges of a rectangle, do not need any rounding.
+        if self._dy == 0:
+            for x in range(self._x, self._x + self._steps):
+                yield Point(x, self._y)
+        elif self._dx == 0:
+            for y in range(self._y, self._y + self._steps):
+                yield Point(self._x, y)
+        else:
+            for i in range(self._steps):
+                yield self._point(i)
+
+    def _point(self, i: int) -> Point:
+        steps = self._steps
+        return Point(
+            self._x + (2 * i * self._dx + steps) // (2 * steps),
+            self._y + (2 * i * self._dy + steps) // (2 * steps),
+        )
+
+
+def draw(rectangles: List[Rectangle], draw_point: Callable[[Point], None] = draw_point):
+    for rectangle in rectangles:
+        for line in rectangle:
+            for p in LinePoints(line):
+                draw_point(p)
+
+
+def measure_draw(adapter, rectangles: List[Rectangle]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for rectangle in rectangles:
+        for line in rectangle:
+            for _ in adapter(line):
+                count += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+if __name__ == "__main__":
+    line = Line(Point(0, 5), Point(1_000_000_000, 5))
+    points = LinePoints(line)
+    assert len(points) == 1_000_000_000
+    assert (points[-1].x, points[-1].y) == (999_999_999, 5)
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for line in [
+            Line(Point(3, 9), Point(3, 1)),
+            Line(Point(8, 1), Point(1, 4)),
+            Line(Point(0, 0), Point(5, 5)),
+        ]:
+            eager = [(p.x, p.y) for p in LineToPointAdapter(line)]
+            assert [(p.x, p.y) for p in LinePoints(line)] == eager
+
+    rectangles = [Rectangle(0, 0, 200_000, 200_000)]
+    for name, adapter in (("eager", LineToPointAdapter), ("lazy", LinePoints)):
+        # The eager adapter announces every line it adapts.
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            count, elapsed, peak = measure_draw(adapter, rectangles)
+        print(
+            f"{name:>5}: {count} points in {elapsed:.2f}s, peak memory {peak / 1e6:.2f}MB"
+        )
@@ -0,0 +1,384 @@
+# Rendering large scenes on several cores.
+# `Framebuffer.draw_lines` runs on a single core. To use all of them, we split the canvas into square
+# tiles and let a process pool draw the tiles, so every worker draws into its own part of the image and
+# no two workers ever write the same pixel. The image lives in shared memory
+# (`multiprocessing.shared_memory`), and workers draw straight into it, so no results are copied.
+# Before that, every line has to be clipped to the tiles it touches, which costs about as much as
+# drawing, so the workers do that in parallel as well, in two phases:
+# 1. Every worker takes a chunk of the lines, clips them to their tiles and writes them, sorted by tile,
+#    to a shared memory block of its own.
+# 2. Every worker draws a tile, reading the lines of that tile from the blocks of all chunks.
+# Every line is clipped exactly to each of its tiles. An axis-aligned line just gets new endpoints, but a
+# diagonal line keeps its endpoints, so that its pixels are rounded just as without tiles, and instead
+# gets the range of its steps that are inside the tile (`step_range`). Only those steps are drawn, and
+# tiles in its bounding box which it does not pass through get no copy of it at all.
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from python_design_patterns.adapter.bresenham import line_points, step_range
+from python_design_patterns.adapter.framebuffer import (
+    Framebuffer,
+    rectangle_coordinates,
+)
+
+# The shared image of the current worker process, attached by `_init_worker`.
+_memory = None
+_pixels = None
+
+
+def _init_worker(name: str, width: int, height: int):
+    global _memory, _pixels
+    _memory = shared_memory.SharedMemory(name=name)
+    _pixels = np.ndarray((height, width), dtype=np.uint8, buffer=_memory.buf)
+
+
+# A block holds `rows` lines of `x0, y0, x1, y1`, followed by the first and last step of `diagonals` of
+# them.
+def _attach(name: str, rows: int, diagonals: int = 0):
+    memory = shared_memory.SharedMemory(name=name)
+    relative = np.ndarray((rows, 4), dtype=np.int32, buffer=memory.buf)
+    steps = np.ndarray(
+        (diagonals, 2), dtype=np.int32, buffer=memory.buf, offset=relative.nbytes
+    )
+    return memory, relative, steps
+
+
+# Phase one: returns the name of the block with the clipped lines, its row and diagonal counts, and for
+# every tile in it the range of its rows and diagonals.
+def _split_chunk(name: str, count: int, start: int, end: int, tile_size: int):
+    memory, coordinates, _ = _attach(name, count)
+    try:
+        height, width = _pixels.shape
+        tiles, relative, steps = split_into_tiles(
+            coordinates[start:end], width, height, tile_size
+        )
+    finally:
+        del coordinates
+        memory.close()
+
+    block = shared_memory.SharedMemory(
+        create=True, size=max(relative.nbytes + steps.nbytes, 1)
+    )
+    np.ndarray(relative.shape, dtype=np.int32, buffer=block.buf)[:] = relative
+    offset = relative.nbytes
+    np.ndarray(steps.shape, dtype=np.int32, buffer=block.buf, offset=offset)[:] = steps
+    block.close()
+    boundaries = np.flatnonzero(np.diff(tiles)) + 1
+    firsts = np.concatenate([[0], boundaries]).astype(np.int64)
+    lasts = np.concatenate([boundaries, [len(tiles)]]).astype(np.int64)
+    # The number of diagonals before every row.
+    diagonals_before = np.zeros(len(relative) + 1, dtype=np.int64)
+    if len(steps):
+        np.cumsum(_is_diagonal(relative), out=diagonals_before[1:])
+    ranges = {
+        int(tiles[first]): (
+            int(first),
+            int(last),
+            int(diagonals_before[first]),
+            int(diagonals_before[last]),
+        )
+        for first, last in zip(firsts, lasts)
+        if first < last
+    }
+    return block.name, len(relative), len(steps), ranges
+
+
+# Phase two: draws the lines of one tile from all blocks that have some.
+def _render_tile(x: int, y: int, width: int, height: int, segments):
+    parts, step_parts = [], []
+    for name, rows, diagonals, first, last, first_diagonal, last_diagonal in segments:
+        memory, relative, steps = _attach(name, rows, diagonals)
+        parts.append(relative[first:last].copy())
+        step_parts.append(steps[first_diagonal:last_diagonal].copy())
+        del relative, steps
+        memory.close()
+    relative = np.concatenate(parts)
+    steps = np.concatenate(step_parts)
+    tile = Framebuffer(width, height, pixels=_pixels[y : y + height, x : x + width])
+    if len(steps) == 0:
+        tile.draw_lines(relative)
+        return
+    diagonal = _is_diagonal(relative)
+    tile.draw_lines(relative[~diagonal])
+    # The steps are already clipped to the tile, so every point is inside of it.
+    _, points = line_points(relative[diagonal], first=steps[:, 0], last=steps[:, 1])
+    tile.pixels[points[:, 1], points[:, 0]] = 1
+
+
+def _is_diagonal(relative: np.ndarray) -> np.ndarray:
+    return (relative[:, 0] != relative[:, 2]) & (relative[:, 1] != relative[:, 3])
+
+
+# Lines are stored in 32 bit integers. Axis-aligned lines keep their pixels when they are clipped to just
+# outside of the canvas, so they can have any coordinates. A diagonal line can not be clipped without
+# changing how its points are rounded, and `step_range` multiplies its coordinates, so they have to be
+# within `MAX_DIAGONAL_COORDINATE`.
+MAX_DIAGONAL_COORDINATE = 2**29
+
+
+def to_int32(coordinates, width: int, height: int) -> np.ndarray:
+    coordinates = np.asarray(coordinates).reshape(-1, 4)
+    if coordinates.dtype != np.int32:
+        coordinates = np.asarray(coordinates, dtype=np.int64)
+    if len(coordinates) == 0 or (
+        coordinates.min() >= -MAX_DIAGONAL_COORDINATE
+        and coordinates.max() <= MAX_DIAGONAL_COORDINATE
+    ):
+        return coordinates.astype(np.int32, copy=False)
+
+    coordinates = coordinates.astype(np.int64)
+    x0, y0, x1, y1 = coordinates.T
+    diagonal = (x0 != x1) & (y0 != y1)
+    if (np.abs(coordinates[diagonal]) > MAX_DIAGONAL_COORDINATE).any():
+        raise ValueError(
+            f"Diagonal lines must have coordinates within +-{MAX_DIAGONAL_COORDINATE}"
+        )
+    np.clip(coordinates[:, 0::2], -1, width, out=coordinates[:, 0::2])
+    np.clip(coordinates[:, 1::2], -1, height, out=coordinates[:, 1::2])
+    return coordinates.astype(np.int32)
+
+
+# Returns the (tile, coordinates) pairs of all lines, with coordinates relative to their tile, sorted by
+# tile, and the first and last step inside the tile of every diagonal among them, in the same order.
+# Everything is done in 32 bit integers, which keeps the memory traffic low.
+def split_into_tiles(
+    coordinates: np.ndarray, width: int, height: int, tile_size: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    coordinates = to_int32(coordinates, width, height)
+    x0, y0, x1, y1 = coordinates.T
+    left, right = np.minimum(x0, x1), np.maximum(x0, x1)
+    top, bottom = np.minimum(y0, y1), np.maximum(y0, y1)
+    visible = np.flatnonzero(
+        (right >= 0) & (left < width) & (bottom >= 0) & (top < height)
+    )
+    first_x = np.clip(left[visible], 0, width - 1) // tile_size
+    last_x = np.clip(right[visible], 0, width - 1) // tile_size
+    first_y = np.clip(top[visible], 0, height - 1) // tile_size
+    last_y = np.clip(bottom[visible], 0, height - 1) // tile_size
+
+    # One entry for every tile in the bounding box of every line. Most lines are within a single tile, so
+    # only the others have to be repeated.
+    columns = last_x - first_x + 1
+    counts = columns * (last_y - first_y + 1)
+    several = np.flatnonzero(counts > 1)
+    single = np.flatnonzero(counts == 1)
+    repeated = np.repeat(several, counts[several])
+    index = np.arange(len(repeated)) - np.repeat(
+        np.cumsum(counts[several]) - counts[several], counts[several]
+    )
+    line = np.concatenate([visible[single], visible[repeated]])
+    tile_x = np.concatenate(
+        [first_x[single], first_x[repeated] + index % columns[repeated]]
+    )
+    tile_y = np.concatenate(
+        [first_y[single], first_y[repeated] + index // columns[repeated]]
+    )
+
+    tiles_per_row = (width + tile_size - 1) // tile_size
+    tiles = tile_y * tiles_per_row + tile_x
+    # Tile numbers fit into 16 bits for any reasonable canvas, and NumPy sorts those in linear time.
+    if tiles.max(initial=0) < 2**15:
+        tiles = tiles.astype(np.int16)
+    order = np.argsort(tiles, kind="stable")
+    tiles, line = tiles[order], line[order]
+    tile_x, tile_y = tile_x[order] * tile_size, tile_y[order] * tile_size
+
+    # Gathering whole rows at once is much friendlier to the cache than gathering column by column.
+    relative = coordinates[line]
+    diagonal = np.flatnonzero(_is_diagonal(relative))
+    unclipped = relative[diagonal]
+    relative[:, 0::2] -= tile_x[:, None]
+    relative[:, 1::2] -= tile_y[:, None]
+    # Axis-aligned lines are clipped to the tile. Their fixed coordinate is already inside of it.
+    np.clip(relative, 0, tile_size - 1, out=relative)
+    steps = np.empty((len(diagonal), 2), dtype=np.int32)
+    if len(diagonal) == 0:
+        return tiles, relative, steps
+
+    # Diagonal lines are clipped to their steps within the tile and the canvas, and dropped from the tiles
+    # which they do not pass through.
+    left, top = tile_x[diagonal], tile_y[diagonal]
+    steps[:, 0], steps[:, 1] = step_range(
+        unclipped,
+        left,
+        top,
+        np.minimum(left + tile_size, width) - 1,
+        np.minimum(top + tile_size, height) - 1,
+    )
+    unclipped[:, 0::2] -= left[:, None]
+    unclipped[:, 1::2] -= top[:, None]
+    relative[diagonal] = unclipped
+    passes = steps[:, 0] <= steps[:, 1]
+    if not passes.all():
+        keep = np.ones(len(line), dtype=bool)
+        keep[diagonal[~passes]] = False
+        tiles, relative, steps = tiles[keep], relative[keep], steps[passes]
+    return tiles, relative, steps
+
+
+class TiledRenderer:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        tile_size: int = 512,
+        max_workers: Optional[int] = None,
+    ):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_workers = max_workers or os.cpu_count()
+        self._memory = shared_memory.SharedMemory(create=True, size=width * height)
+        self.framebuffer = Framebuffer(
+            width,
+            height,
+            pixels=np.ndarray((height, width), dtype=np.uint8, buffer=self._memory.buf),
+        )
+        self.framebuffer.clear()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self._memory.name, width, height),
+        )
+
+    # Draws an (n, 4) array of `x0, y0, x1, y1` rows into `framebuffer`.
+    def render(self, coordinates: np.ndarray):
+        coordinates = to_int32(coordinates, self.width, self.height)
+        count = len(coordinates)
+        if count == 0:
+            return
+        memory = shared_memory.SharedMemory(create=True, size=count * 16)
+        blocks = []
+        try:
+            np.ndarray((count, 4), dtype=np.int32, buffer=memory.buf)[:] = coordinates
+            chunk_size = -(-count // self.max_workers)
+            splits = [
+                self.executor.submit(
+                    _split_chunk,
+                    memory.name,
+                    count,
+                    start,
+                    min(start + chunk_size, count),
+                    self.tile_size,
+                )
+                for start in range(0, count, chunk_size)
+            ]
+            segments: Dict[int, list] = {}
+            for split in splits:
+                name, rows, diagonals, ranges = split.result()
+                blocks.append(name)
+                for tile, tile_range in ranges.items():
+                    segments.setdefault(tile, []).append(
+                        (name, rows, diagonals) + tile_range
+                    )
+
+            tiles_per_row = -(-self.width // self.tile_size)
+            renders = []
+            for tile, tile_segments in segments.items():
+                tile_y, tile_x = divmod(tile, tiles_per_row)
+                x, y = tile_x * self.tile_size, tile_y * self.tile_size
+                renders.append(
+                    self.executor.submit(
+                        _render_tile,
+                        x,
+                        y,
+                        min(self.tile_size, self.width - x),
+                        min(self.tile_size, self.height - y),
+                        tile_segments,
+                    )
+                )
+            for future in wait(renders).done:
+                future.result()
+        finally:
+            memory.close()
+            memory.unlink()
+            for name in blocks:
+                block = shared_memory.SharedMemory(name=name)
+                block.close()
+                block.unlink()
+
+    def close(self):
+        self.executor.shutdown()
+        # Drop our view before releasing the memory it points into.
+        self.framebuffer = None
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def random_rectangles(count: int, size: int, seed: int = 0) -> np.ndarray:
+    generator = np.random.default_rng(seed)
+    x, y = generator.integers(0, size, (2, count))
+    width, height = generator.integers(1, 100, (2, count))
+    return rectangle_coordinates(x, y, width, height)
+
+
+def benchmark_tiled(
+    count: int = 1_000_000, size: int = 4000, worker_counts: List[int] = (1, 2, 4, 8)
+):
+    coordinates = random_rectangles(count, size)
+    reference = Framebuffer(size, size)
+    start = time.perf_counter()
+    reference.draw_lines(coordinates)
+    print(f"single process: {time.perf_counter() - start:.2f}s")
+
+    for workers in worker_counts:
+        with TiledRenderer(size, size, max_workers=workers) as renderer:
+            # Start the workers before timing.
+            renderer.render(coordinates[:1])
+            renderer.framebuffer.clear()
+            start = time.perf_counter()
+            renderer.render(coordinates)
+            elapsed = time.perf_counter() - start
+            assert (renderer.framebuffer.pixels == reference.pixels).all()
+        print(f"{workers} workers: {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    coordinates = np.concatenate(
+        [random_rectangles(2000, 300), [(0, 0, 299, 299), (299, 0, 0, 250)]]
+    )
+    reference = Framebuffer(300, 300)
+    reference.draw_lines(coordinates)
+    with TiledRenderer(300, 300, tile_size=64, max_workers=2) as renderer:
+        renderer.render(coordinates)
+        assert (renderer.framebuffer.pixels == reference.pixels).all()
+
+    # Diagonals crossing many tiles, some of them partly outside of the canvas.
+    diagonals = np.random.default_rng(2).integers(-100, 400, (2000, 4))
+    reference.clear()
+    reference.draw_lines(diagonals)
+    with TiledRenderer(300, 300, tile_size=32, max_workers=2) as renderer:
+        renderer.render(diagonals)
+        assert (renderer.framebuffer.pixels == reference.pixels).all()
+    # A diagonal only goes to the tiles it passes through, not to its whole bounding box.
+    tiles, _, steps = split_into_tiles([(0, 0, 127, 127)], 128, 128, 32)
+    assert tiles.tolist() == [0, 5, 10, 15]
+    assert steps.tolist() == [[0, 31], [32, 63], [64, 95], [96, 127]]
+
+    # Coordinates beyond 32 bits must not wrap around.
+    huge = [(0, 5, 2**32 + 10, 5), (3, 3, 3, 2**31 + 5), (-(2**40), 7, 10, 7)]
+    reference = Framebuffer(64, 64)
+    reference.draw_lines(huge)
+    with TiledRenderer(64, 64, tile_size=16, max_workers=2) as renderer:
+        renderer.render(huge)
+        assert (renderer.framebuffer.pixels == reference.pixels).all()
+        try:
+            renderer.render([(0, 0, 2**31, 2**31)])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("a huge diagonal line must be rejected")
+
+    benchmark_tiled()
@@ -0,0 +1,215 @@
+# An asyncio command bus.
+# An async front end should not run bank account commands itself, but hand them to a bus. The bus keeps
+# one bounded queue per worker and always puts the commands of an account into the same queue, so they
+# run in the order they were submitted. If a queue is full, `submit` waits until a worker made room,
+# which slows down producers instead of letting the queues grow without limit (backpressure).
+# A command touching several accounts, like a `MoneyTransferCommand`, is put into the queues of all its
+# accounts. It runs once every involved worker has reached it, so it keeps its place in the order of
+# every account. Such commands are enqueued one at a time, so that they are in the same relative order
+# in all queues and workers can never wait for each other in a cycle. Once a worker has reached such an
+# entry it waits for the others, so the entry has to end up in all of its queues: cancelling `submit`
+# does not stop it from being enqueued. A command without any account, like an empty composite, runs
+# right away.
+from __future__ import annotations
+import asyncio
+from collections import deque
+import time
+from typing import List, Optional
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    CompositeBankAccountCommand,
+    MoneyTransferCommand,
+    leaves,
+)
+
+
+class _Entry:
+    def __init__(self, command: Command, workers: int):
+        self.command = command
+        self.done = asyncio.get_running_loop().create_future()
+        self.submitted = time.perf_counter()
+        # Number of workers that still have to reach this entry.
+        self.waiting_for = workers
+
+
+class AsyncCommandBus:
+    def __init__(
+        self,
+        worker_count: int = 8,
+        queue_size: int = 1000,
+        latency_samples: int = 10_000,
+    ):
+        self.worker_count = worker_count
+        self.queue_size = queue_size
+        self.latencies = deque(maxlen=latency_samples)
+        self.completed = 0
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._multi_queue_lock: Optional[asyncio.Lock] = None
+
+    async def start(self):
+        self._queues = [
+            asyncio.Queue(maxsize=self.queue_size) for _ in range(self.worker_count)
+        ]
+        self._multi_queue_lock = asyncio.Lock()
+        self._workers = [
+            asyncio.create_task(self._work(queue)) for queue in self._queues
+        ]
+
+    # Returns a future that is done once the command ran.
+    async def submit(self, command: Command) -> asyncio.Future:
+        queues = sorted(
+            {hash(leaf.account) % self.worker_count for leaf in leaves(command)}
+        )
+        entry = _Entry(command, len(queues))
+        if not queues:
+            self._run(entry)
+        elif len(queues) == 1:
+            await self._queues[queues[0]].put(entry)
+        else:
+            await asyncio.shield(
+                asyncio.create_task(self._put_everywhere(entry, queues))
+            )
+        return entry.done
+
+    async def _put_everywhere(self, entry: _Entry, queues: List[int]):
+        async with self._multi_queue_lock:
+            for queue in queues:
+                await self._queues[queue].put(entry)
+
+    async def join(self):
+        for queue in self._queues:
+            await queue.join()
+
+    async def stop(self):
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def queue_depths(self) -> List[int]:
+        return [queue.qsize() for queue in self._queues]
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return {
+            "completed": self.completed,
+            "queue_depth": sum(self.queue_depths()),
+            "max_queue_depth": max(self.queue_depths(), default=0),
+            "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            entry = await queue.get()
+            entry.waiting_for -= 1
+            if entry.waiting_for == 0:
+                self._run(entry)
+            else:
+                # Hold this queue until the other workers reached the entry as well.
+                await asyncio.wait([entry.done])
+            queue.task_done()
+
+    def _run(self, entry: _Entry):
+        try:
+            entry.command.invoke()
+        except Exception as exception:
+            entry.done.set_exception(exception)
+        else:
+            entry.done.set_result(entry.command)
+        self.completed += 1
+        self.latencies.append(time.perf_counter() - entry.submitted)
+
+
+def make_commands(accounts: List[BankAccount], steps: int) -> List[Command]:
+    commands = []
+    for step in range(steps):
+        account = accounts[step % len(accounts)]
+        commands.append(
+            BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 10)
+        )
+        commands.append(
+            BankAccountCommand(account, BankAccountCommand.Action.WITHDRAW, 300)
+        )
+        commands.append(
+            MoneyTransferCommand(account, accounts[(step * 7 + 1) % len(accounts)], 50)
+        )
+    return commands
+
+
+class TestSuite(unittest.TestCase):
+    def test_matches_sequential_execution(self):
+        sequential = [BankAccount(100 * i) for i in range(6)]
+        for command in make_commands(sequential, 300):
+            command.invoke()
+
+        async def run():
+            accounts = [BankAccount(100 * i) for i in range(6)]
+            async with AsyncCommandBus(worker_count=3, queue_size=4) as bus:
+                futures = []
+                for command in make_commands(accounts, 300):
+                    futures.append(await bus.submit(command))
+                    self.assertLessEqual(bus.metrics()["max_queue_depth"], 4)
+                await asyncio.gather(*futures)
+            return accounts, bus.metrics()
+
+        accounts, metrics = asyncio.run(run())
+        self.assertEqual(metrics["completed"], 900)
+        self.assertEqual(
+            [account.balance for account in accounts],
+            [account.balance for account in sequential],
+        )
+
+    def test_command_without_accounts(self):
+        async def run():
+            async with AsyncCommandBus(worker_count=2) as bus:
+                done = await bus.submit(CompositeBankAccountCommand([]))
+                await asyncio.wait_for(done, 1)
+
+        asyncio.run(run())
+
+    def test_cancelled_submit_still_enqueues_everywhere(self):
+        async def run():
+            bus = AsyncCommandBus(worker_count=3, queue_size=1)
+            await bus.start()
+            # Stop the workers for now, so that the queues fill up.
+            for worker in bus._workers:
+                worker.cancel()
+            accounts = [BankAccount(100) for _ in range(20)]
+            by_queue = {hash(account) % 3: account for account in accounts}
+            first, second = (by_queue[queue] for queue in sorted(by_queue)[:2])
+            await bus.submit(
+                BankAccountCommand(second, BankAccountCommand.Action.DEPOSIT, 10)
+            )
+            # The transfer goes into the first queue, then waits for room in the second one.
+            submit = asyncio.create_task(
+                bus.submit(MoneyTransferCommand(first, second, 50))
+            )
+            await asyncio.sleep(0.01)
+            submit.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await submit
+            bus._workers = [
+                asyncio.create_task(bus._work(queue)) for queue in bus._queues
+            ]
+            await asyncio.wait_for(bus.stop(), 1)
+            return first.balance, second.balance
+
+        self.assertEqual(asyncio.run(run()), (50, 160))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# Audit sinks for bank accounts.
+# Printing a message on every deposit and withdrawal costs much more than the operation itself, and all
+# threads have to wait for stdout. Instead, a bank account hands its operations to an audit sink, which
+# decides what to do with them: nothing at all, keep the latest ones in memory or write them to a file
+# in batches. Sinks receive the raw values and only format messages when they are read or written.
+from __future__ import annotations
+from collections import deque
+import threading
+import time
+from typing import List, Optional
+
+
+def format_record(action: str, amount: int, balance: int) -> str:
+    if action == "deposit":
+        return f"Deposited {amount}, new balance: {balance}"
+    else:
+        return f"Withdrew {amount}, new balance is {balance}"
+
+
+class AuditSink:
+    # Accounts skip calling `record` if this is False.
+    enabled = True
+
+    def record(self, action: str, amount: int, balance: int):
+        pass
+
+
+class NullSink(AuditSink):
+    enabled = False
+
+
+class PrintSink(AuditSink):
+    def record(self, action: str, amount: int, balance: int):
+        print(format_record(action, amount, balance))
+
+
+class RingBufferSink(AuditSink):
+    def __init__(self, capacity: int = 10_000):
+        self.records = deque(maxlen=capacity)
+
+    def record(self, action: str, amount: int, balance: int):
+        self.records.append((action, amount, balance))
+
+    def messages(self) -> List[str]:
+        return [format_record(*record) for record in self.records]
+
+
+# Collects records in memory and appends them to a file once `max_records` are collected or the oldest
+# record is `max_delay` seconds old. A background thread takes care of the time limit if no further
+# records arrive.
+class BatchedFileSink(AuditSink):
+    def __init__(self, path: str, max_records: int = 10_000, max_delay: float = 1.0):
+        self.path = path
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._records = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def record(self, action: str, amount: int, balance: int):
+        with self._lock:
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._records.append((action, amount, balance))
+            if len(self._records) >= self.max_records:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def close(self):
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.max_delay / 2):
+            with self._lock:
+                if (
+                    self._oldest is not None
+                    and time.monotonic() - self._oldest >= self.max_delay
+                ):
+                    self._write()
+
+    # Must be called with the lock held.
+    def _write(self):
+        if not self._records:
+            return
+        with open(self.path, "a") as file:
+            file.write(
+                "".join(f"{format_record(*record)}\n" for record in self._records)
+            )
+        self._records = []
+        self._oldest = None
+
+
+if __name__ == "__main__":
+    from python_design_patterns.command.composite_command import (
+        BankAccount,
+        BankAccountCommand,
+    )
+
+    buffer = RingBufferSink(capacity=2)
+    account = BankAccount(0, audit_sink=buffer)
+    for amount in (10, 20, 30):
+        BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, amount).invoke()
+    assert buffer.messages() == [
+        "Deposited 20, new balance: 30",
+        "Deposited 30, new balance: 60",
+    ]
+
+    account = BankAccount(0)
+    start = time.perf_counter()
+    for _ in range(1_000_000):
+        account.deposit(1)
+    print(f"1M deposits without auditing: {time.perf_counter() - start:.2f}s")
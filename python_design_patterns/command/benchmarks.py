@@ -0,0 +1,231 @@
+# Benchmarks for the command pattern.
+# Every case builds fresh accounts and commands, then times `invoke` and `undo` separately. Cases are
+# repeated and the fastest run is kept, since slower runs only measure noise from the rest of the
+# machine. Results are reported in nanoseconds per command and written as JSON, so that a later run
+# can be compared against a stored baseline:
+#     benchmark-commands --output results.json --baseline baseline.json
+# exits with status 1 if a case got slower than the baseline by more than the tolerance.
+from __future__ import annotations
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    CompositeBankAccountCommand,
+    MoneyTransferCommand,
+)
+
+COMPOSITE_SIZES = (10, 1_000, 100_000)
+# Timings are noisy, so only a slowdown of more than 20% counts as a regression.
+DEFAULT_TOLERANCE = 0.2
+
+
+def make_composite(
+    accounts: List[BankAccount],
+    size: int,
+    transfer_share: float = 0.0,
+    failure_share: float = 0.0,
+    seed: int = 0,
+) -> CompositeBankAccountCommand:
+    generator = random.Random(seed)
+    commands = []
+    for _ in range(size):
+        account = generator.choice(accounts)
+        if generator.random() < transfer_share:
+            amount = 10_000 if generator.random() < failure_share else 50
+            commands.append(
+                MoneyTransferCommand(account, generator.choice(accounts), amount)
+            )
+        elif generator.random() < failure_share:
+            # Always more than the overdraft limit allows, so the withdrawal is rejected.
+            commands.append(
+                BankAccountCommand(account, BankAccountCommand.Action.WITHDRAW, 10_000)
+            )
+        elif generator.random() < 0.5:
+            commands.append(
+                BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 100)
+            )
+        else:
+            commands.append(
+                BankAccountCommand(account, BankAccountCommand.Action.WITHDRAW, 100)
+            )
+    return CompositeBankAccountCommand(commands)
+
+
+def single_command() -> Tuple[Command, int]:
+    account = BankAccount(0)
+    return BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 100), 1
+
+
+def composite_case(
+    size: int, transfer_share: float = 0.0, failure_share: float = 0.0
+) -> Callable[[], Tuple[Command, int]]:
+    accounts = [BankAccount(1000) for _ in range(100)]
+    seeds = itertools.count()
+
+    def setup():
+        composite = make_composite(
+            accounts, size, transfer_share, failure_share, next(seeds)
+        )
+        return composite, size
+
+    return setup
+
+
+def cases(sizes=COMPOSITE_SIZES) -> Dict[str, Callable[[], Tuple[Command, int]]]:
+    result = {"single": single_command}
+    for size in sizes:
+        result[f"composite_{size}"] = composite_case(size)
+    largest = max(sizes)
+    result[f"transfer_heavy_{largest}"] = composite_case(largest, transfer_share=0.8)
+    result[f"failure_heavy_{largest}"] = composite_case(largest, failure_share=0.8)
+    return result
+
+
+# Runs `setup` until about `min_commands` commands were timed per repeat, so small cases are not
+# dominated by the resolution of the clock.
+def measure(
+    setup: Callable[[], Tuple[Command, int]],
+    repeat: int = 5,
+    min_commands: int = 100_000,
+) -> Dict[str, float]:
+    best_invoke = best_undo = float("inf")
+    for _ in range(repeat):
+        built = []
+        commands = 0
+        while commands < min_commands:
+            command, size = setup()
+            built.append((command, size))
+            commands += size
+
+        # Like `timeit`, keep the garbage collector from running in the middle of a measurement.
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            for command, _ in built:
+                command.invoke()
+            invoked = time.perf_counter_ns()
+            for command, _ in reversed(built):
+                command.undo()
+            undone = time.perf_counter_ns()
+        finally:
+            gc.enable()
+        best_invoke = min(best_invoke, (invoked - start) / commands)
+        best_undo = min(best_undo, (undone - invoked) / commands)
+    return {"invoke_ns": best_invoke, "undo_ns": best_undo}
+
+
+def run_suite(
+    sizes=COMPOSITE_SIZES, repeat: int = 5, min_commands: int = 100_000
+) -> Dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {
+            name: measure(setup, repeat, min_commands)
+            for name, setup in cases(sizes).items()
+        },
+    }
+
+
+# Returns a message for every timing that is more than `tolerance` slower than in the baseline.
+def compare(
+    results: Dict[str, object],
+    baseline: Dict[str, object],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> List[str]:
+    regressions = []
+    for name, timings in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for metric, value in timings.items():
+            if metric in reference and value > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {metric}: {value:.1f} vs. {reference[metric]:.1f} "
+                    f"(+{value / reference[metric] - 1:.0%})"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark bank account commands.")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against the results in this file")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args(argv)
+
+    results = run_suite(repeat=arguments.repeat)
+    for name, timings in results["results"].items():
+        print(
+            f"{name:>22}: invoke {timings['invoke_ns']:7.1f}ns, "
+            f"undo {timings['undo_ns']:7.1f}ns per command"
+        )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if arguments.baseline is None:
+        return 0
+    if arguments.update_baseline or not os.path.exists(arguments.baseline):
+        with open(arguments.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        return 0
+    with open(arguments.baseline) as file:
+        regressions = compare(results, json.load(file), arguments.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+class TestSuite(unittest.TestCase):
+    def test_suite_covers_all_cases(self):
+        results = run_suite(sizes=(10, 100), repeat=1, min_commands=100)
+        self.assertEqual(
+            sorted(results["results"]),
+            sorted(
+                [
+                    "single",
+                    "composite_10",
+                    "composite_100",
+                    "transfer_heavy_100",
+                    "failure_heavy_100",
+                ]
+            ),
+        )
+        json.dumps(results)
+
+    def test_failure_heavy_rejects_commands(self):
+        composite, _ = composite_case(1000, failure_share=0.8)()
+        composite.invoke()
+        failures = sum(not command.success for command in composite)
+        self.assertGreater(failures, 700)
+
+    def test_compare_reports_regressions(self):
+        baseline = {"results": {"single": {"invoke_ns": 100.0, "undo_ns": 100.0}}}
+        results = {"results": {"single": {"invoke_ns": 105.0, "undo_ns": 150.0}}}
+        regressions = compare(results, baseline, tolerance=0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("single undo_ns"))
+
+    def test_compare_uses_default_tolerance(self):
+        baseline = {"results": {"single": {"invoke_ns": 100.0}}}
+        within = {"results": {"single": {"invoke_ns": 100.0 * (1 + DEFAULT_TOLERANCE)}}}
+        self.assertEqual(compare(within, baseline), [])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
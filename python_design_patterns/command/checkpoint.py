@@ -0,0 +1,268 @@
+# Checkpoints and compaction for the command journal.
+# Rebuilding the balances from the journal replays every command ever executed, which gets slower every
+# day. Instead, we periodically write a checkpoint: the balance of every account together with the
+# position in the journal it corresponds to. Recovery loads the latest checkpoint and replays only the
+# records after it.
+# The journal is split into segments of a fixed number of records. Once a checkpoint exists, the
+# segments before it are no longer needed and a background job can delete them.
+from __future__ import annotations
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import unittest
+
+import numpy as np
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    MoneyTransferCommand,
+)
+from python_design_patterns.command.journal import (
+    RECORD,
+    CommandJournal,
+    apply_records,
+    read_records,
+)
+
+_segment_name = re.compile(r"^segment-(\d{20})\.bin$")
+_checkpoint_name = re.compile(r"^checkpoint-(\d{20})\.npz$")
+
+
+def segment_path(directory: str, start: int):
+    return os.path.join(directory, f"segment-{start:020d}.bin")
+
+
+def checkpoint_path(directory: str, offset: int):
+    return os.path.join(directory, f"checkpoint-{offset:020d}.npz")
+
+
+# Returns (position of the first record, path) of every file matching `pattern`, oldest first.
+def _list_files(directory: str, pattern) -> List[Tuple[int, str]]:
+    files = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            files.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def list_segments(directory: str):
+    return _list_files(directory, _segment_name)
+
+
+def list_checkpoints(directory: str):
+    return _list_files(directory, _checkpoint_name)
+
+
+def write_checkpoint(directory: str, offset: int, balances: Dict[int, int]):
+    accounts = np.fromiter(balances.keys(), dtype=np.uint64, count=len(balances))
+    values = np.fromiter(balances.values(), dtype=np.int64, count=len(balances))
+    # Write to a temporary file first, so that a crash never leaves a partial checkpoint behind.
+    temporary = os.path.join(directory, f".checkpoint-{offset:020d}.tmp")
+    with open(temporary, "wb") as file:
+        np.savez(file, accounts=accounts, balances=values)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, checkpoint_path(directory, offset))
+
+
+def read_checkpoint(path: str) -> Dict[int, int]:
+    with np.load(path) as checkpoint:
+        return dict(
+            zip(checkpoint["accounts"].tolist(), checkpoint["balances"].tolist())
+        )
+
+
+# Returns the balances after all records in `directory` and the number of records.
+def recover(directory: str) -> Tuple[Dict[int, int], int]:
+    balances = {}
+    offset = 0
+    checkpoints = list_checkpoints(directory)
+    if checkpoints:
+        offset, path = checkpoints[-1]
+        balances = read_checkpoint(path)
+
+    end = offset
+    for start, path in list_segments(directory):
+        count = os.path.getsize(path) // RECORD.size
+        if start + count <= offset:
+            continue
+        skip = max(offset - start, 0)
+        balances = apply_records(read_records(path, skip * RECORD.size), balances)
+        end = start + count
+    return balances, end
+
+
+# Deletes all segments and checkpoints that are older than the `keep_checkpoints` latest checkpoints.
+# The last segment is never deleted, as it might be open for writing.
+def compact(directory: str, keep_checkpoints: int = 1):
+    checkpoints = list_checkpoints(directory)
+    if len(checkpoints) < keep_checkpoints or keep_checkpoints < 1:
+        return
+    oldest_needed = checkpoints[-keep_checkpoints][0]
+    for _, path in checkpoints[:-keep_checkpoints]:
+        os.remove(path)
+
+    segments = list_segments(directory)
+    for (_, path), (next_start, _) in zip(segments, segments[1:]):
+        if next_start <= oldest_needed:
+            os.remove(path)
+
+
+class Compactor(threading.Thread):
+    def __init__(
+        self, directory: str, interval: float = 60.0, keep_checkpoints: int = 1
+    ):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.interval = interval
+        self.keep_checkpoints = keep_checkpoints
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            compact(self.directory, self.keep_checkpoints)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+# A `CommandJournal` writing to segments in `directory`. On start it recovers the accounts from the
+# latest checkpoint and the records after it; they are available in `accounts` by their id.
+class SegmentedJournal(CommandJournal):
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 1_000_000,
+        checkpoint_on_rollover: bool = True,
+        **kwargs,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.checkpoint_on_rollover = checkpoint_on_rollover
+
+        balances, self.offset = recover(directory)
+        segments = list_segments(directory)
+        self._segment_start = segments[-1][0] if segments else self.offset
+        super().__init__(segment_path(directory, self._segment_start), **kwargs)
+
+        self.accounts = {}
+        for account_id, balance in balances.items():
+            account = BankAccount(balance)
+            self.accounts[account_id] = account
+            self.account_ids[id(account)] = account_id
+        if balances:
+            self._next_account_id = max(self._next_account_id, max(balances) + 1)
+
+    def add_account(self, account: BankAccount, account_id: Optional[int] = None):
+        account_id = super().add_account(account, account_id)
+        self.accounts[account_id] = account
+        self._roll_over_if_full()
+        return account_id
+
+    # A segment is only rolled over between commands, so that a checkpoint never contains half of
+    # a composite command.
+    def invoke(self, command: Command):
+        super().invoke(command)
+        self._roll_over_if_full()
+
+    def undo(self, command: Command):
+        super().undo(command)
+        self._roll_over_if_full()
+
+    # Writes the balances of all accounts as of the current end of the journal.
+    def checkpoint(self):
+        self.commit()
+        write_checkpoint(
+            self.directory,
+            self.offset,
+            {
+                account_id: account.balance
+                for account_id, account in self.accounts.items()
+            },
+        )
+
+    def _append(self, account_id: int, action: int, success: bool, amount: int):
+        super()._append(account_id, action, success, amount)
+        self.offset += 1
+
+    def _roll_over_if_full(self):
+        if self.offset - self._segment_start >= self.segment_size:
+            self._roll_over()
+
+    def _roll_over(self):
+        self.commit()
+        self._file.close()
+        self._segment_start = self.offset
+        self.path = segment_path(self.directory, self.offset)
+        self._file = open(self.path, "ab", buffering=self.buffer_size)
+        if self.checkpoint_on_rollover:
+            self.checkpoint()
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_commands(self, journal: SegmentedJournal, accounts: List[BankAccount]):
+        for amount in range(1, 30):
+            journal.invoke(
+                BankAccountCommand(
+                    accounts[amount % 3], BankAccountCommand.Action.DEPOSIT, amount
+                )
+            )
+            journal.invoke(
+                MoneyTransferCommand(accounts[amount % 3], accounts[0], amount * 10)
+            )
+
+    def test_recover_after_compaction(self):
+        directory = self.directory.name
+        with SegmentedJournal(directory, segment_size=10) as journal:
+            accounts = [BankAccount(100 * i) for i in range(3)]
+            for account in accounts:
+                journal.add_account(account)
+            self.run_commands(journal, accounts)
+            expected = [account.balance for account in accounts]
+
+        self.assertGreater(len(list_segments(directory)), 5)
+        compact(directory)
+        self.assertEqual(len(list_checkpoints(directory)), 1)
+        self.assertLessEqual(len(list_segments(directory)), 2)
+
+        with SegmentedJournal(directory, segment_size=10) as journal:
+            self.assertEqual([journal.accounts[i].balance for i in range(3)], expected)
+            journal.invoke(
+                BankAccountCommand(
+                    journal.accounts[1], BankAccountCommand.Action.WITHDRAW, 5
+                )
+            )
+            journal.add_account(BankAccount(7))
+
+        balances, _ = recover(directory)
+        self.assertEqual(
+            balances, {0: expected[0], 1: expected[1] - 5, 2: expected[2], 3: 7}
+        )
+
+    def test_compactor_thread(self):
+        directory = self.directory.name
+        with SegmentedJournal(directory, segment_size=5) as journal:
+            self.run_commands(journal, [BankAccount(0) for _ in range(3)])
+        compactor = Compactor(directory, interval=0.01)
+        compactor.start()
+        time.sleep(0.2)
+        compactor.stop()
+        self.assertEqual(len(list_checkpoints(directory)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+# Coalescing the commands of a composite command.
+# A large `CompositeBankAccountCommand` often contains runs of deposits to the same account. Every one of
+# them is a separate method call on invoke and again on undo. An optional optimization pass replaces
+# every run of adjacent commands with the same account and action by one command for the total amount.
+# Deposits can always be merged. A run of withdrawals only succeeds as a whole if the account can cover
+# the total, and then every single withdrawal would have succeeded as well. Otherwise some of them
+# would be rejected, so we fall back to running them one by one. The same holds for the withdrawals
+# undoing a run of deposits. Either way, the balances and the `success` flags of the original commands
+# are exactly the same as without the optimization.
+from __future__ import annotations
+import random
+import time
+from typing import List
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    CompositeBankAccountCommand,
+    MoneyTransferCommand,
+)
+
+
+class CoalescedBankAccountCommand(Command):
+    def __init__(self, commands: List[BankAccountCommand]):
+        super().__init__()
+        self.commands = commands
+        self.account = commands[0].account
+        self.action = commands[0].action
+        self.amount = sum(command.amount for command in commands)
+
+    def invoke(self):
+        if self.action == BankAccountCommand.Action.DEPOSIT:
+            self.success = self.account.deposit(self.amount)
+        elif self._can_withdraw():
+            self.success = self.account.withdraw(self.amount)
+        else:
+            for command in self.commands:
+                command.invoke()
+            self.success = False
+            return
+        for command in self.commands:
+            command.success = self.success
+
+    def undo(self):
+        if not self.success:
+            for command in reversed(self.commands):
+                command.undo()
+        elif self.action == BankAccountCommand.Action.WITHDRAW:
+            self.account.deposit(self.amount)
+        elif self._can_withdraw():
+            self.account.withdraw(self.amount)
+        else:
+            for command in reversed(self.commands):
+                command.undo()
+
+    def _can_withdraw(self):
+        return self.account.balance - self.amount >= BankAccount.OVERDRAFT_LIMIT
+
+
+def coalesce(composite: CompositeBankAccountCommand) -> CompositeBankAccountCommand:
+    result = CompositeBankAccountCommand()
+    run = []
+    for command in list(composite) + [None]:
+        if (
+            run
+            and type(command) is BankAccountCommand
+            and command.account is run[0].account
+            and command.action == run[0].action
+            and command.amount >= 0
+        ):
+            run.append(command)
+            continue
+        if len(run) > 1:
+            result.append(CoalescedBankAccountCommand(run))
+        elif run:
+            result.append(run[0])
+        run = []
+        if type(command) is BankAccountCommand and command.amount >= 0:
+            run = [command]
+        elif command is not None:
+            result.append(command)
+    return result
+
+
+def random_composite(
+    accounts: List[BankAccount], size: int, seed: int = 0, deposit_share: float = 0.5
+):
+    generator = random.Random(seed)
+    commands = []
+    account = accounts[0]
+    for _ in range(size):
+        if generator.random() < 0.1:
+            account = generator.choice(accounts)
+        if generator.random() < 0.02:
+            commands.append(
+                MoneyTransferCommand(account, generator.choice(accounts), 100)
+            )
+        else:
+            if generator.random() < deposit_share:
+                action = BankAccountCommand.Action.DEPOSIT
+            else:
+                action = BankAccountCommand.Action.WITHDRAW
+            commands.append(
+                BankAccountCommand(account, action, generator.randint(0, 300))
+            )
+    return CompositeBankAccountCommand(commands)
+
+
+def benchmark_coalescing(size: int = 100_000):
+    for name, optimize in (("plain", lambda c: c), ("coalesced", coalesce)):
+        accounts = [BankAccount(0) for _ in range(10)]
+        composite = optimize(random_composite(accounts, size, deposit_share=0.9))
+        start = time.perf_counter()
+        composite.invoke()
+        invoked = time.perf_counter()
+        composite.undo()
+        undone = time.perf_counter()
+        print(
+            f"{name:>9}: {len(composite)} commands, invoke {invoked - start:.3f}s, "
+            f"undo {undone - invoked:.3f}s"
+        )
+
+
+class TestSuite(unittest.TestCase):
+    def test_same_state_as_plain_composite(self):
+        for seed in range(20):
+            plain_accounts = [BankAccount(0) for _ in range(3)]
+            coalesced_accounts = [BankAccount(0) for _ in range(3)]
+            plain = random_composite(plain_accounts, 500, seed)
+            original = random_composite(coalesced_accounts, 500, seed)
+            coalesced = coalesce(original)
+            self.assertLess(len(coalesced), len(original))
+
+            plain.invoke()
+            coalesced.invoke()
+            self.assertEqual(
+                [account.balance for account in plain_accounts],
+                [account.balance for account in coalesced_accounts],
+            )
+            self.assertEqual(
+                [command.success for command in plain],
+                [command.success for command in original],
+            )
+
+            plain.undo()
+            coalesced.undo()
+            self.assertEqual(
+                [account.balance for account in plain_accounts],
+                [account.balance for account in coalesced_accounts],
+            )
+
+
+if __name__ == "__main__":
+    benchmark_coalescing()
+    unittest.main()
@@ -3,22 +3,30 @@
 # information necessary for the action to be taken.
 from abc import ABC
 from enum import Enum
+from typing import Optional
+
+from python_design_patterns.command.audit import AuditSink, NullSink, PrintSink
 
 
 class BankAccount:
     OVERDRAFT_LIMIT = -500
+    audit_sink: AuditSink = NullSink()
 
-    def __init__(self, balance: int) -> None:
+    def __init__(self, balance: int, audit_sink: Optional[AuditSink] = None) -> None:
         self.balance = balance
+        if audit_sink is not None:
+            self.audit_sink = audit_sink
 
     def deposit(self, amount: int) -> None:
         self.balance += amount
-        print(f"Deposited {amount}, new balance: {self.balance}")
+        if self.audit_sink.enabled:
+            self.audit_sink.record("deposit", amount, self.balance)
 
     def withdraw(self, amount):
         if self.balance - amount >= BankAccount.OVERDRAFT_LIMIT:
             self.balance -= amount
-            print(f"Withdrew {amount}, new balance is {self.balance}")
+            if self.audit_sink.enabled:
+                self.audit_sink.record("withdraw", amount, self.balance)
 
     def __str__(self):
         return f"Balance: {self.balance}"
@@ -62,7 +70,7 @@ class BankAccountCommand(Command):
 
 
 if __name__ == "__main__":
-    bank_account = BankAccount(balance=0)
+    bank_account = BankAccount(balance=0, audit_sink=PrintSink())
     command = BankAccountCommand(bank_account, BankAccountCommand.Action.DEPOSIT, 100)
     command.invoke()
     print(bank_account)
@@ -84,23 +92,29 @@ if __name__ == "__main__":
     illegal_command.undo()
     print(bank_account)
 
+
 # UUH! We just made 10000 euro ;)
 # Let's fix it.
 class BankAccount:
     OVERDRAFT_LIMIT = -500
+    audit_sink: AuditSink = NullSink()
 
-    def __init__(self, balance: int) -> None:
+    def __init__(self, balance: int, audit_sink: Optional[AuditSink] = None) -> None:
         self.balance = balance
+        if audit_sink is not None:
+            self.audit_sink = audit_sink
 
     def deposit(self, amount: int) -> None:
         self.balance += amount
-        print(f"Deposited {amount}, new balance: {self.balance}")
+        if self.audit_sink.enabled:
+            self.audit_sink.record("deposit", amount, self.balance)
         return True
 
     def withdraw(self, amount):
         if self.balance - amount >= BankAccount.OVERDRAFT_LIMIT:
             self.balance -= amount
-            print(f"Withdrew {amount}, new balance is {self.balance}")
+            if self.audit_sink.enabled:
+                self.audit_sink.record("withdraw", amount, self.balance)
             return True
         else:
             return False
@@ -149,7 +163,7 @@ class BankAccountCommand(Command):
 
 if __name__ == "__main__":
     print("After fixing undoing impossible withdraws:")
-    bank_account = BankAccount(balance=0)
+    bank_account = BankAccount(balance=0, audit_sink=PrintSink())
 
     illegal_command = BankAccountCommand(
         bank_account, BankAccountCommand.Action.WITHDRAW, 10000
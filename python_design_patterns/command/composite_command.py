@@ -2,27 +2,34 @@
 # A command is an object that represents an instruction to perform a particual action. Contains all the
 # information necessary for the action to be taken.
 from __future__ import annotations
-from typing import List
+from typing import List, Optional
 from abc import ABC
 import unittest
 from enum import Enum
 
+from python_design_patterns.command.audit import AuditSink, NullSink
+
 
 class BankAccount:
     OVERDRAFT_LIMIT = -500
+    audit_sink: AuditSink = NullSink()
 
-    def __init__(self, balance: int) -> None:
+    def __init__(self, balance: int, audit_sink: Optional[AuditSink] = None) -> None:
         self.balance = balance
+        if audit_sink is not None:
+            self.audit_sink = audit_sink
 
     def deposit(self, amount: int) -> None:
         self.balance += amount
-        print(f"Deposited {amount}, new balance: {self.balance}")
+        if self.audit_sink.enabled:
+            self.audit_sink.record("deposit", amount, self.balance)
         return True
 
     def withdraw(self, amount):
         if self.balance - amount >= BankAccount.OVERDRAFT_LIMIT:
             self.balance -= amount
-            print(f"Withdrew {amount}, new balance is {self.balance}")
+            if self.audit_sink.enabled:
+                self.audit_sink.record("withdraw", amount, self.balance)
             return True
         else:
             return False
@@ -103,10 +110,18 @@ class MoneyTransferCommand(CompositeBankAccountCommand):
         ok = True
         for command in self:
             if ok:
-                ok = command.invoke()
+                command.invoke()
+                ok = command.success
             else:
                 command.success = False
-            self.success = ok
+        self.success = ok
+
+
+# The `BankAccountCommand`s of a command, with all composites flattened, in the order they are invoked.
+def leaves(command: Command) -> List[BankAccountCommand]:
+    if isinstance(command, list):
+        return [leaf for child in command for leaf in leaves(child)]
+    return [command]
 
 
 class TestSuite(unittest.TestCase):
@@ -0,0 +1,105 @@
+# Executing bank account commands from many threads.
+# `BankAccount.deposit` and `withdraw` read and then write the balance, so two threads working on the
+# same account can lose an update, and a `MoneyTransferCommand` can be observed half done. An executor
+# therefore locks all accounts a command touches while it runs. To keep the number of locks bounded,
+# accounts are mapped onto a fixed number of lock stripes. A transfer needs two locks, and two transfers
+# in opposite directions could each hold one and wait for the other forever. We prevent this deadlock
+# by always acquiring the locks in the same global order: by stripe index.
+from __future__ import annotations
+from contextlib import ExitStack, contextmanager
+import random
+import threading
+import time
+from typing import List
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    MoneyTransferCommand,
+    leaves,
+)
+
+
+class LockingCommandExecutor:
+    def __init__(self, stripes: int = 1024):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def invoke(self, command: Command):
+        with self._locked(command):
+            command.invoke()
+
+    def undo(self, command: Command):
+        with self._locked(command):
+            command.undo()
+
+    @contextmanager
+    def _locked(self, command: Command):
+        stripes = sorted(
+            {hash(leaf.account) % len(self._locks) for leaf in leaves(command)}
+        )
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            yield
+
+
+def run_threads(thread_count: int, target, *args):
+    threads = [
+        threading.Thread(target=target, args=(index, *args))
+        for index in range(thread_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def benchmark_executor(commands_per_thread: int = 20_000, max_threads: int = 8):
+    def work(index, executor, accounts):
+        account = accounts[index]
+        for _ in range(commands_per_thread):
+            executor.invoke(
+                BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 1)
+            )
+
+    for thread_count in range(1, max_threads + 1):
+        executor = LockingCommandExecutor()
+        accounts = [BankAccount(0) for _ in range(thread_count)]
+        start = time.perf_counter()
+        run_threads(thread_count, work, executor, accounts)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{thread_count} threads: "
+            f"{thread_count * commands_per_thread / elapsed:,.0f} commands/s"
+        )
+
+
+class TestSuite(unittest.TestCase):
+    def test_money_is_conserved(self):
+        accounts = [BankAccount(1000) for _ in range(10)]
+        executor = LockingCommandExecutor(stripes=4)
+        transfers: List[MoneyTransferCommand] = []
+
+        def work(index):
+            generator = random.Random(index)
+            for _ in range(2000):
+                source, target = generator.sample(accounts, 2)
+                transfer = MoneyTransferCommand(
+                    source, target, generator.randint(1, 700)
+                )
+                executor.invoke(transfer)
+                transfers.append(transfer)
+
+        run_threads(8, work)
+
+        self.assertEqual(len(transfers), 16_000)
+        self.assertEqual(sum(account.balance for account in accounts), 10_000)
+        for account in accounts:
+            self.assertGreaterEqual(account.balance, BankAccount.OVERDRAFT_LIMIT)
+
+
+if __name__ == "__main__":
+    benchmark_executor()
+    unittest.main()
@@ -0,0 +1,275 @@
+# A durable journal of bank account commands.
+# Keeping all commands in memory means that the history is lost together with the process. Instead,
+# we append every executed command to a binary journal. Every record has the same size, so the journal
+# can be read back without parsing: memory-map the file and interpret it as an array of records.
+# Writing is buffered, and the file is only synced to disk once per group of records ("group commit"),
+# as an fsync per command would limit us to a few hundred commands per second.
+from __future__ import annotations
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+import unittest
+
+import numpy as np
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    Command,
+    MoneyTransferCommand,
+    leaves,
+)
+
+# An `OPEN` record stores the balance an account had when it was added to the journal.
+OPEN = 0
+DEPOSIT = BankAccountCommand.Action.DEPOSIT.value
+WITHDRAW = BankAccountCommand.Action.WITHDRAW.value
+
+# account id, action, success, padding, amount
+RECORD = struct.Struct("<QBB6xq")
+RECORD_DTYPE = np.dtype(
+    [
+        ("account", "<u8"),
+        ("action", "u1"),
+        ("success", "u1"),
+        ("padding", "V6"),
+        ("amount", "<i8"),
+    ]
+)
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class CommandJournal:
+    def __init__(
+        self,
+        path: str,
+        commit_every: int = 1000,
+        commit_interval: float = 0.05,
+        buffer_size: int = 1 << 20,
+    ):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.buffer_size = buffer_size
+        self.account_ids = {}
+        # Continue after the accounts of an existing journal.
+        last_account_id = max_account_id(path) if os.path.exists(path) else None
+        self._next_account_id = 0 if last_account_id is None else last_account_id + 1
+        # Drop a partially written record left by a crash, so that new records stay aligned.
+        if os.path.exists(path) and os.path.getsize(path) % RECORD.size:
+            os.truncate(path, os.path.getsize(path) // RECORD.size * RECORD.size)
+        self._file = open(path, "ab", buffering=buffer_size)
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    # Accounts are identified by an integer in the journal. Accounts of the invoked commands are added
+    # automatically; call this to choose the id yourself.
+    def add_account(self, account: BankAccount, account_id: Optional[int] = None):
+        if account_id is None:
+            account_id = self._next_account_id
+        self._next_account_id = max(self._next_account_id, account_id + 1)
+        self.account_ids[id(account)] = account_id
+        self._append(account_id, OPEN, True, account.balance)
+        return account_id
+
+    def invoke(self, command: Command):
+        # New accounts have to be added with the balance they had before the command.
+        command_leaves = leaves(command)
+        account_ids = [self._account_id(leaf.account) for leaf in command_leaves]
+        command.invoke()
+        for leaf, account_id in zip(command_leaves, account_ids):
+            self._append(account_id, leaf.action.value, leaf.success, leaf.amount)
+
+    # Undoing a command is journaled as the inverse action. The inverse withdrawal of a deposit can be
+    # rejected by the overdraft limit, so we check whether the balance actually changed.
+    def undo(self, command: Command):
+        for leaf in reversed(leaves(command)):
+            if leaf.success:
+                balance = leaf.account.balance
+                leaf.undo()
+                inverse = WITHDRAW if leaf.action.value == DEPOSIT else DEPOSIT
+                self._append(
+                    self._account_id(leaf.account),
+                    inverse,
+                    leaf.account.balance != balance,
+                    leaf.amount,
+                )
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _account_id(self, account: BankAccount):
+        account_id = self.account_ids.get(id(account), None)
+        if account_id is None:
+            account_id = self.add_account(account)
+        return account_id
+
+    def _append(self, account_id: int, action: int, success: bool, amount: int):
+        self._file.write(RECORD.pack(account_id, action, success, amount))
+        self._uncommitted += 1
+        if (
+            self._uncommitted >= self.commit_every
+            or time.monotonic() - self._last_commit >= self.commit_interval
+        ):
+            self.commit()
+
+
+def read_records(path: str, offset: int = 0) -> np.ndarray:
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        # A crash can leave a partially written record at the end, which we ignore.
+        count = (size - offset) // RECORD.size
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return np.frombuffer(
+                mapped, RECORD_DTYPE, count=count, offset=offset
+            ).copy()
+
+
+# Returns the largest account id in the journal, or None if it is empty. Unlike `read_records`, this
+# reads the mapped file in place, so it needs no memory for a copy of the journal.
+def max_account_id(path: str) -> Optional[int]:
+    with open(path, "rb") as file:
+        count = os.fstat(file.fileno()).st_size // RECORD.size
+        if count == 0:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            records = np.frombuffer(mapped, RECORD_DTYPE, count=count)
+            maximum = int(records["account"].max())
+            # The map can only be closed once no array points into it.
+            del records
+    return maximum
+
+
+# Rebuilds the balance of every account from the records, starting from `balances`. Only successful
+# records change a balance. An `OPEN` record resets the balance of its account.
+def apply_records(records: np.ndarray, balances: Optional[Dict[int, int]] = None):
+    balances = dict(balances or {})
+    records = records[records["success"] != 0]
+    # Account ids are usually dense, so they can index the totals directly without sorting.
+    if len(records) and int(records["account"].max()) < 4 * len(records) + (1 << 20):
+        inverse = records["account"].astype(np.intp)
+        accounts = np.arange(int(inverse.max()) + 1)
+    else:
+        accounts, inverse = np.unique(records["account"], return_inverse=True)
+    positions = np.arange(len(records))
+
+    opened = records["action"] == OPEN
+    last_open = np.full(len(accounts), -1, dtype=np.int64)
+    np.maximum.at(last_open, inverse[opened], positions[opened])
+    keep = positions >= last_open[inverse]
+
+    deltas = np.where(
+        records["action"] == WITHDRAW, -records["amount"], records["amount"]
+    )
+    totals = np.zeros(len(accounts), dtype=np.int64)
+    np.add.at(totals, inverse[keep], deltas[keep])
+    present = np.zeros(len(accounts), dtype=bool)
+    present[inverse] = True
+    for account, total, was_opened in zip(
+        accounts[present].tolist(),
+        totals[present].tolist(),
+        (last_open >= 0)[present].tolist(),
+    ):
+        balances[account] = total if was_opened else balances.get(account, 0) + total
+    return balances
+
+
+def replay(path: str) -> Dict[int, int]:
+    return apply_records(read_records(path))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Rebuild account balances from a command journal."
+    )
+    parser.add_argument("journal")
+    arguments = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    balances = replay(arguments.journal)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(arguments.journal)
+    for account, balance in sorted(balances.items()):
+        print(f"{account}\t{balance}")
+    print(
+        f"Replayed {size // RECORD.size} records in {elapsed:.3f}s "
+        f"({size / max(elapsed, 1e-9) / 1e6:.0f}MB/s)",
+        file=sys.stderr,
+    )
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "journal.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_matches_balances(self):
+        first = BankAccount(100)
+        second = BankAccount(0)
+        with CommandJournal(self.path) as journal:
+            journal.invoke(
+                BankAccountCommand(first, BankAccountCommand.Action.DEPOSIT, 50)
+            )
+            journal.invoke(MoneyTransferCommand(first, second, 120))
+            journal.invoke(MoneyTransferCommand(second, first, 10_000))
+            withdraw = BankAccountCommand(
+                second, BankAccountCommand.Action.WITHDRAW, 20
+            )
+            journal.invoke(withdraw)
+            journal.undo(withdraw)
+
+        self.assertEqual(replay(self.path), {0: first.balance, 1: second.balance})
+        self.assertEqual(replay(self.path), {0: 30, 1: 120})
+
+    def test_partial_record_is_ignored(self):
+        with CommandJournal(self.path) as journal:
+            journal.add_account(BankAccount(5))
+        with open(self.path, "ab") as file:
+            file.write(b"\x01\x02")
+        self.assertEqual(replay(self.path), {0: 5})
+
+    def test_reopen_continues_account_ids(self):
+        with CommandJournal(self.path, commit_every=100_000) as journal:
+            account = BankAccount(0)
+            journal.add_account(BankAccount(0), account_id=7)
+            for _ in range(100_000):
+                journal.invoke(
+                    BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 1)
+                )
+        tracemalloc.start()
+        journal = CommandJournal(self.path, buffer_size=4096)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with journal:
+            self.assertEqual(journal.add_account(BankAccount(3)), 9)
+        # Far less than the 3.2MB of records.
+        self.assertLess(peak, 1_000_000)
+        self.assertEqual(replay(self.path), {7: 0, 8: 100_000, 9: 3})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# A ledger partitioned across processes.
+# When the accounts do not fit into one process, every worker process (shard) holds a part of them:
+# account `i` lives on shard `i % shard_count`. A transfer between two accounts of the same shard is an
+# ordinary `MoneyTransferCommand` run by that shard. A transfer between two shards uses a two-phase
+# commit, coordinated by the process owning the ledger:
+# 1. Prepare: the source shard runs the withdrawal and votes whether it succeeded. The target shard
+#    checks that the account exists; a deposit can not be rejected, so it only runs on commit.
+# 2. Commit if both voted yes: the target shard runs the deposit. Otherwise abort: the source shard
+#    rolls back the withdrawal with the command's `undo`.
+# Messages are sent in batches per shard, so all shards work on a batch at the same time.
+# A batch gives the same results as running its transfers one by one: it is split, in order, into rounds,
+# and every shard runs its part of a round in the order of the batch. A cross-shard transfer only
+# settles when its round is decided, so a round ends before the first transfer touching an account of
+# a cross-shard transfer still pending in it. The decisions are sent along with the next round.
+from __future__ import annotations
+from collections import defaultdict
+import multiprocessing
+import os
+import random
+import time
+import traceback
+from typing import Dict, List, Tuple
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+    MoneyTransferCommand,
+)
+
+Transfer = Tuple[int, int, int]
+
+
+def _shard_main(connection):
+    accounts: Dict[int, BankAccount] = {}
+    prepared: Dict[int, BankAccountCommand] = {}
+    while True:
+        operation, payload = connection.recv()
+        if operation == "stop":
+            connection.send((True, None))
+            return
+        # An unexpected error is sent to the ledger instead of taking the shard down with it.
+        try:
+            result = _handle(operation, payload, accounts, prepared)
+        except Exception:
+            connection.send((False, traceback.format_exc()))
+        else:
+            connection.send((True, result))
+
+
+def _handle(operation: str, payload, accounts, prepared):
+    if operation == "open":
+        for account_id, balance in payload:
+            accounts[account_id] = BankAccount(balance)
+    elif operation == "run":
+        commits, aborts, items = payload
+        for transaction in commits:
+            command = prepared.pop(transaction)
+            if command.action == BankAccountCommand.Action.DEPOSIT:
+                command.invoke()
+        for transaction in reversed(aborts):
+            command = prepared.pop(transaction, None)
+            if (
+                command is not None
+                and command.action == BankAccountCommand.Action.WITHDRAW
+            ):
+                command.undo()
+        results = []
+        for kind, *arguments in items:
+            if kind == "transfer":
+                results.append(_transfer(accounts, *arguments))
+            else:
+                results.append(_prepare(accounts, prepared, *arguments))
+        return results
+    elif operation == "balances":
+        return {account_id: account.balance for account_id, account in accounts.items()}
+    else:
+        raise ValueError(f"Unknown operation {operation}")
+
+
+def _transfer(accounts, source: int, target: int, amount: int) -> bool:
+    # Just like across shards, a transfer from or to an unknown account fails.
+    if source not in accounts or target not in accounts:
+        return False
+    transfer = MoneyTransferCommand(accounts[source], accounts[target], amount)
+    transfer.invoke()
+    return transfer.success
+
+
+def _prepare(
+    accounts, prepared, transaction: int, account_id: int, action, amount: int
+):
+    if account_id not in accounts:
+        return False
+    command = BankAccountCommand(accounts[account_id], action, amount)
+    prepared[transaction] = command
+    if action == BankAccountCommand.Action.WITHDRAW:
+        command.invoke()
+        return command.success
+    return True
+
+
+class ShardedLedger:
+    def __init__(self, shard_count: int = os.cpu_count()):
+        self.shard_count = shard_count
+        self._connections = []
+        self._processes = []
+        self._next_transaction = 0
+        for _ in range(shard_count):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_main, args=(child,), daemon=True
+            )
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def shard_of(self, account_id: int):
+        return account_id % self.shard_count
+
+    def open_accounts(self, balances: Dict[int, int]):
+        per_shard = defaultdict(list)
+        for account_id, balance in balances.items():
+            per_shard[self.shard_of(account_id)].append((account_id, balance))
+        self._exchange("open", per_shard)
+
+    def transfer(self, source: int, target: int, amount: int) -> bool:
+        return self.transfer_many([(source, target, amount)])[0]
+
+    # Returns whether each transfer succeeded, just as if they had been run one by one.
+    def transfer_many(self, transfers: List[Transfer]) -> List[bool]:
+        results = [False] * len(transfers)
+        commits, aborts = defaultdict(list), defaultdict(list)
+        start = 0
+        while True:
+            items = defaultdict(list)
+            # The position in the batch and the transaction of every item sent to a shard.
+            origins = defaultdict(list)
+            transactions = {}
+            pending = set()
+            end = start
+            while end < len(transfers):
+                source, target, amount = transfers[end]
+                if source in pending or target in pending:
+                    break
+                source_shard = self.shard_of(source)
+                target_shard = self.shard_of(target)
+                if source_shard == target_shard:
+                    items[source_shard].append(("transfer", source, target, amount))
+                    origins[source_shard].append((end, None))
+                else:
+                    transaction = self._next_transaction
+                    self._next_transaction += 1
+                    transactions[transaction] = (end, source_shard, target_shard)
+                    pending.update((source, target))
+                    for shard, account_id, action in (
+                        (source_shard, source, BankAccountCommand.Action.WITHDRAW),
+                        (target_shard, target, BankAccountCommand.Action.DEPOSIT),
+                    ):
+                        items[shard].append(
+                            ("prepare", transaction, account_id, action, amount)
+                        )
+                        origins[shard].append((end, transaction))
+                end += 1
+
+            # Settle the previous round and run this one: local transfers, and phase one of the others.
+            shards = set(items) | set(commits) | set(aborts)
+            replies = self._exchange(
+                "run",
+                {
+                    shard: (commits[shard], aborts[shard], items[shard])
+                    for shard in shards
+                },
+            )
+            votes = defaultdict(lambda: True)
+            for shard, shard_results in replies.items():
+                for (position, transaction), success in zip(
+                    origins[shard], shard_results
+                ):
+                    if transaction is None:
+                        results[position] = success
+                    else:
+                        votes[transaction] = votes[transaction] and success
+
+            # Phase two is sent with the next round.
+            commits, aborts = defaultdict(list), defaultdict(list)
+            for transaction, (
+                position,
+                source_shard,
+                target_shard,
+            ) in transactions.items():
+                decision = commits if votes[transaction] else aborts
+                decision[source_shard].append(transaction)
+                decision[target_shard].append(transaction)
+                results[position] = votes[transaction]
+            start = end
+            if start == len(transfers) and not transactions:
+                return results
+
+    def balances(self) -> Dict[int, int]:
+        balances = {}
+        for shard_balances in self._exchange(
+            "balances", {shard: None for shard in range(self.shard_count)}
+        ).values():
+            balances.update(shard_balances)
+        return balances
+
+    def close(self):
+        self._exchange("stop", {shard: None for shard in range(self.shard_count)})
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Sends one message to every shard in `payloads` and waits for all their answers.
+    def _exchange(self, operation: str, payloads: Dict[int, object]):
+        for shard, payload in payloads.items():
+            self._connections[shard].send((operation, payload))
+        # Receive all answers before raising, so that every pipe stays in sync.
+        replies = {shard: self._connections[shard].recv() for shard in payloads}
+        for shard, (ok, result) in replies.items():
+            if not ok:
+                raise RuntimeError(f"Shard {shard} failed to {operation}:\n{result}")
+        return {shard: result for shard, (_, result) in replies.items()}
+
+
+def random_transfers(account_count: int, count: int, seed: int = 0) -> List[Transfer]:
+    generator = random.Random(seed)
+    transfers = []
+    for _ in range(count):
+        source, target = generator.sample(range(account_count), 2)
+        transfers.append((source, target, generator.randint(1, 300)))
+    return transfers
+
+
+def benchmark_ledger(
+    account_count: int = 10_000,
+    transfer_count: int = 200_000,
+    batch_size: int = 10_000,
+    shard_counts=(1, 2, 4, 8),
+):
+    transfers = random_transfers(account_count, transfer_count)
+    for shard_count in shard_counts:
+        with ShardedLedger(shard_count) as ledger:
+            ledger.open_accounts({account: 1000 for account in range(account_count)})
+            start = time.perf_counter()
+            for batch in range(0, transfer_count, batch_size):
+                ledger.transfer_many(transfers[batch : batch + batch_size])
+            elapsed = time.perf_counter() - start
+            assert sum(ledger.balances().values()) == 1000 * account_count
+        print(f"{shard_count} shards: {transfer_count / elapsed:,.0f} transfers/s")
+
+
+class TestSuite(unittest.TestCase):
+    def test_money_is_conserved(self):
+        with ShardedLedger(3) as ledger:
+            ledger.open_accounts({account: 100 for account in range(12)})
+            results = ledger.transfer_many(random_transfers(12, 2000))
+            balances = ledger.balances()
+        self.assertIn(False, results)
+        self.assertIn(True, results)
+        self.assertEqual(sum(balances.values()), 1200)
+        for balance in balances.values():
+            self.assertGreaterEqual(balance, BankAccount.OVERDRAFT_LIMIT)
+
+    def test_batch_matches_transfers_one_by_one(self):
+        transfers = random_transfers(12, 2000, seed=3)
+        accounts = [BankAccount(100) for _ in range(12)]
+        expected = []
+        for source, target, amount in transfers:
+            transfer = MoneyTransferCommand(accounts[source], accounts[target], amount)
+            transfer.invoke()
+            expected.append(transfer.success)
+        with ShardedLedger(3) as ledger:
+            ledger.open_accounts({account: 100 for account in range(12)})
+            self.assertEqual(ledger.transfer_many(transfers), expected)
+            self.assertEqual(
+                ledger.balances(),
+                {account: accounts[account].balance for account in range(12)},
+            )
+
+    def test_batch_spends_cross_shard_deposit(self):
+        with ShardedLedger(2) as ledger:
+            ledger.open_accounts({0: 0, 1: 1000, 2: 0})
+            # The second transfer can only succeed once the first one has been committed.
+            self.assertEqual(
+                ledger.transfer_many([(1, 0, 1000), (0, 2, 1000)]), [True, True]
+            )
+            self.assertEqual(ledger.balances(), {0: 0, 1: 0, 2: 1000})
+
+    def test_cross_shard_transfer(self):
+        with ShardedLedger(2) as ledger:
+            ledger.open_accounts({0: 100, 1: 0})
+            self.assertTrue(ledger.transfer(0, 1, 600))
+            self.assertFalse(ledger.transfer(0, 1, 1))
+            # Account 2 on the other shard does not exist, so the withdrawal is rolled back.
+            self.assertFalse(ledger.transfer(1, 2, 50))
+            self.assertEqual(ledger.balances(), {0: -500, 1: 600})
+
+    def test_local_transfer_to_unknown_account(self):
+        with ShardedLedger(2) as ledger:
+            ledger.open_accounts({0: 100, 1: 0})
+            # Account 2 would be on the same shard as account 0.
+            self.assertFalse(ledger.transfer(0, 2, 10))
+            self.assertFalse(ledger.transfer(2, 0, 10))
+            self.assertTrue(ledger.transfer(0, 1, 10))
+            self.assertEqual(ledger.balances(), {0: 90, 1: 10})
+
+    def test_shard_survives_errors(self):
+        with ShardedLedger(2) as ledger:
+            ledger.open_accounts({0: 100, 1: 0})
+            with self.assertRaises(RuntimeError):
+                ledger._exchange("unknown", {0: None})
+            self.assertEqual(ledger.balances(), {0: 100, 1: 0})
+
+
+if __name__ == "__main__":
+    benchmark_ledger()
+    unittest.main()
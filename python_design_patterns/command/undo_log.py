@@ -0,0 +1,265 @@
+# A compact undo history for bank account commands.
+# To undo commands later, we would have to keep every `BankAccountCommand` alive, and every one of them
+# is a Python object with its own `__dict__`. All that `undo` really needs is the account, the action,
+# the amount and whether the command succeeded. So instead we store exactly these four values in packed
+# arrays, using 18 bytes per command.
+# The log supports undo and redo and keeps at most `max_bytes` of history in memory. Older history is
+# either dropped or, if a spill file is given, moved to disk in blocks and read back when undo needs it.
+# The same holds the other way round: undoing far back pushes the far end of the redo history out of
+# memory, into a second file next to the spill file.
+from __future__ import annotations
+from array import array
+import os
+import random
+import struct
+import sys
+import tempfile
+from typing import List, Optional
+import unittest
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+)
+
+DEPOSIT = BankAccountCommand.Action.DEPOSIT.value
+WITHDRAW = BankAccountCommand.Action.WITHDRAW.value
+ENTRY_SIZE = 8 + 1 + 8 + 1
+_count = struct.Struct("<Q")
+
+
+class UndoLog:
+    def __init__(self, max_bytes: int = 64 << 20, spill_path: Optional[str] = None):
+        self.max_entries = max(2, max_bytes // ENTRY_SIZE)
+        self.spill_path = spill_path
+        self.accounts: List[BankAccount] = []
+        self._account_index = {}
+        self._accounts = array("Q")
+        self._actions = array("b")
+        self._amounts = array("q")
+        self._success = array("b")
+        # Entries before `_cursor` can be undone, entries from `_cursor` on can be redone.
+        self._cursor = 0
+        # Entries spilled from the old end of the undo history and from the far end of the redo history.
+        self._spilled = 0
+        self._redo_spilled = 0
+        self._redo_path = None if spill_path is None else spill_path + ".redo"
+        for path in (self.spill_path, self._redo_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def invoke(self, command: BankAccountCommand):
+        command.success = self.execute(
+            command.account, command.action.value, command.amount
+        )
+
+    # Runs the action on the account and returns whether it succeeded.
+    def execute(self, account: BankAccount, action: int, amount: int):
+        success = self._apply(account, action, amount)
+        for values in self._columns():
+            del values[self._cursor :]
+        if self._redo_spilled:
+            os.remove(self._redo_path)
+            self._redo_spilled = 0
+        self._accounts.append(self._index(account))
+        self._actions.append(action)
+        self._amounts.append(amount)
+        self._success.append(success)
+        self._cursor += 1
+        if len(self._actions) > self.max_entries:
+            self._evict()
+        return success
+
+    # Returns False if there is nothing left to undo.
+    def undo(self):
+        if self._cursor == 0 and not self._restore():
+            return False
+        self._cursor -= 1
+        if self._success[self._cursor]:
+            account = self.accounts[self._accounts[self._cursor]]
+            amount = self._amounts[self._cursor]
+            if self._actions[self._cursor] == DEPOSIT:
+                account.withdraw(amount)
+            else:
+                account.deposit(amount)
+        return True
+
+    # Returns False if there is nothing left to redo.
+    def redo(self):
+        if self._cursor == len(self._actions) and not self._restore_redo():
+            return False
+        account = self.accounts[self._accounts[self._cursor]]
+        self._success[self._cursor] = self._apply(
+            account, self._actions[self._cursor], self._amounts[self._cursor]
+        )
+        self._cursor += 1
+        return True
+
+    def __len__(self):
+        return self._spilled + len(self._actions) + self._redo_spilled
+
+    @property
+    def memory_usage(self):
+        return len(self._actions) * ENTRY_SIZE
+
+    def _apply(self, account: BankAccount, action: int, amount: int):
+        if action == DEPOSIT:
+            return bool(account.deposit(amount))
+        else:
+            return bool(account.withdraw(amount))
+
+    def _index(self, account: BankAccount):
+        index = self._account_index.get(id(account), None)
+        if index is None:
+            index = len(self.accounts)
+            self._account_index[id(account)] = index
+            self.accounts.append(account)
+        return index
+
+    def _columns(self):
+        return self._accounts, self._actions, self._amounts, self._success
+
+    # Moves the oldest half of the undoable entries to the spill file, or drops them without one.
+    def _evict(self):
+        count = min(self.max_entries // 2, self._cursor)
+        if count == 0:
+            return
+        if self.spill_path is not None:
+            self._spill(self.spill_path, 0, count)
+            self._spilled += count
+        for values in self._columns():
+            del values[:count]
+        self._cursor -= count
+
+    # Moves the redo entries beyond the memory limit to the redo spill file, or drops them without one.
+    def _evict_redo(self):
+        start = max(self.max_entries, self._cursor)
+        count = len(self._actions) - start
+        if count <= 0:
+            return
+        if self._redo_path is not None:
+            self._spill(self._redo_path, start, len(self._actions))
+            self._redo_spilled += count
+        for values in self._columns():
+            del values[start:]
+
+    # Reads the most recently spilled block back in front of the entries in memory.
+    def _restore(self):
+        if self._spilled == 0:
+            return False
+        columns = self._unspill(self.spill_path)
+        count = len(columns[0])
+        self._accounts, self._actions, self._amounts, self._success = (
+            restored + values for restored, values in zip(columns, self._columns())
+        )
+        self._cursor += count
+        self._spilled -= count
+        self._evict_redo()
+        return True
+
+    # Reads the nearest block of redo entries back behind the entries in memory.
+    def _restore_redo(self):
+        if self._redo_spilled == 0:
+            return False
+        columns = self._unspill(self._redo_path)
+        for values, restored in zip(self._columns(), columns):
+            values.extend(restored)
+        self._redo_spilled -= len(columns[0])
+        while len(self._actions) > self.max_entries:
+            self._evict()
+        return True
+
+    # Appends the entries from `start` to `end` to the file as one block.
+    def _spill(self, path: str, start: int, end: int):
+        with open(path, "ab") as file:
+            file.write(_count.pack(end - start))
+            for values in self._columns():
+                file.write(values[start:end].tobytes())
+            file.write(_count.pack(end - start))
+
+    # Removes the last block from the file and returns its columns.
+    def _unspill(self, path: str):
+        with open(path, "r+b") as file:
+            file.seek(-_count.size, os.SEEK_END)
+            (count,) = _count.unpack(file.read(_count.size))
+            block_size = 2 * _count.size + count * ENTRY_SIZE
+            start = file.seek(-block_size, os.SEEK_END)
+            data = memoryview(file.read(block_size))[_count.size :]
+            file.truncate(start)
+
+        columns = (array("Q"), array("b"), array("q"), array("b"))
+        offset = 0
+        for values in columns:
+            size = count * values.itemsize
+            values.frombytes(data[offset : offset + size])
+            offset += size
+        return columns
+
+
+class TestSuite(unittest.TestCase):
+    def run_random_commands(self, log: UndoLog, accounts: List[BankAccount]):
+        generator = random.Random(0)
+        history = []
+        for _ in range(1000):
+            history.append([account.balance for account in accounts])
+            log.execute(
+                generator.choice(accounts),
+                generator.choice([DEPOSIT, WITHDRAW]),
+                generator.randint(0, 400),
+            )
+        return history
+
+    def test_undo_redo(self):
+        account = BankAccount(0)
+        log = UndoLog()
+        log.invoke(BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 100))
+        log.invoke(
+            BankAccountCommand(account, BankAccountCommand.Action.WITHDRAW, 9999)
+        )
+        self.assertTrue(log.undo())
+        self.assertTrue(log.undo())
+        self.assertFalse(log.undo())
+        self.assertEqual(account.balance, 0)
+        self.assertTrue(log.redo())
+        self.assertEqual(account.balance, 100)
+
+    def test_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            accounts = [BankAccount(0) for _ in range(3)]
+            log = UndoLog(
+                max_bytes=50 * ENTRY_SIZE, spill_path=os.path.join(directory, "undo")
+            )
+            history = self.run_random_commands(log, accounts)
+            history.append([account.balance for account in accounts])
+            self.assertLessEqual(log.memory_usage, 50 * ENTRY_SIZE)
+            self.assertEqual(len(log), 1000)
+            for balances in reversed(history[:-1]):
+                self.assertTrue(log.undo())
+                self.assertEqual([account.balance for account in accounts], balances)
+                self.assertLessEqual(log.memory_usage, 50 * ENTRY_SIZE)
+            self.assertFalse(log.undo())
+            self.assertEqual(len(log), 1000)
+
+            for balances in history[1:]:
+                self.assertTrue(log.redo())
+                self.assertEqual([account.balance for account in accounts], balances)
+                self.assertLessEqual(log.memory_usage, 50 * ENTRY_SIZE)
+            self.assertFalse(log.redo())
+
+    def test_eviction_without_spill_file(self):
+        accounts = [BankAccount(0) for _ in range(3)]
+        log = UndoLog(max_bytes=50 * ENTRY_SIZE)
+        self.run_random_commands(log, accounts)
+        self.assertLessEqual(len(log), 50)
+        while log.undo():
+            self.assertLessEqual(log.memory_usage, 50 * ENTRY_SIZE)
+
+
+if __name__ == "__main__":
+    account = BankAccount(0)
+    command = BankAccountCommand(account, BankAccountCommand.Action.DEPOSIT, 1)
+    command_size = sys.getsizeof(command) + sys.getsizeof(command.__dict__)
+    print(
+        f"BankAccountCommand: {command_size} bytes, undo log entry: {ENTRY_SIZE} bytes"
+    )
+    unittest.main()
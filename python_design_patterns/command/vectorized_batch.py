@@ -0,0 +1,222 @@
+# Applying a whole batch of bank account commands at once.
+# Invoking millions of `BankAccountCommand`s one by one costs a Python method call per command. If we
+# keep the balances of all accounts in one NumPy array and the commands in three arrays (account,
+# action, amount), we can settle the whole batch with array operations.
+# The tricky part is the overdraft rule: whether a withdrawal succeeds depends on all earlier commands
+# on the same account. We first assume that every command succeeds and compute the running balance of
+# every account. The first withdrawal of an account that overdraws it is certainly rejected, as all
+# commands before it are settled. Rejecting it only raises the later balances, so later withdrawals
+# that already succeed keep succeeding. We repeat this until no withdrawal overdraws its account.
+# That takes one round per rejection on the account with the most rejections, and every round costs as
+# much as the whole batch. So after `max_rounds` rounds, the accounts that still have overdrawing
+# withdrawals are settled one command after the other instead.
+from __future__ import annotations
+import random
+import time
+from typing import List
+import unittest
+
+import numpy as np
+
+from python_design_patterns.command.composite_command import (
+    BankAccount,
+    BankAccountCommand,
+)
+
+DEPOSIT = BankAccountCommand.Action.DEPOSIT.value
+WITHDRAW = BankAccountCommand.Action.WITHDRAW.value
+
+
+class BankAccountBatch:
+    def __init__(self, balances: np.ndarray, max_rounds: int = 8):
+        self.balances = np.array(balances, dtype=np.int64)
+        self.max_rounds = max_rounds
+
+    # Applies the commands in order and returns for every command whether it succeeded.
+    def apply(
+        self, accounts: np.ndarray, actions: np.ndarray, amounts: np.ndarray
+    ) -> np.ndarray:
+        accounts = np.asarray(accounts, dtype=np.int64)
+        actions = np.asarray(actions)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        if len(accounts) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # Group the commands by account, keeping their order within every account.
+        order = np.argsort(accounts, kind="stable")
+        accounts = accounts[order]
+        deltas = np.where(actions[order] == WITHDRAW, -amounts[order], amounts[order])
+        withdrawals = actions[order] == WITHDRAW
+        group_starts = np.flatnonzero(np.r_[True, accounts[1:] != accounts[:-1]])
+        group_of_command = np.repeat(
+            group_starts, np.diff(np.r_[group_starts, len(accounts)])
+        )
+        initial_balances = self.balances[accounts]
+
+        succeeded = np.ones(len(accounts), dtype=bool)
+        # Without any rounds, every account with a withdrawal is settled one command after the other.
+        overdrawn = np.flatnonzero(withdrawals)
+        for _ in range(self.max_rounds):
+            applied = np.where(succeeded, deltas, 0)
+            running = np.cumsum(applied)
+            before_group = running[group_of_command] - applied[group_of_command]
+            balances_after = initial_balances + running - before_group
+            overdrawn = np.flatnonzero(
+                withdrawals & succeeded & (balances_after < BankAccount.OVERDRAFT_LIMIT)
+            )
+            if len(overdrawn) == 0:
+                break
+            first_per_account = np.r_[
+                True, accounts[overdrawn][1:] != accounts[overdrawn][:-1]
+            ]
+            succeeded[overdrawn[first_per_account]] = False
+        else:
+            self._settle_sequentially(
+                np.unique(group_of_command[overdrawn]),
+                group_starts,
+                initial_balances,
+                deltas,
+                withdrawals,
+                succeeded,
+            )
+
+        applied = np.where(succeeded, deltas, 0)
+        np.add.at(self.balances, accounts, applied)
+        success = np.empty(len(accounts), dtype=bool)
+        success[order] = succeeded
+        return success
+
+    # Decides `succeeded` for every command of the given groups by running through them in order.
+    @staticmethod
+    def _settle_sequentially(
+        starts, group_starts, initial_balances, deltas, withdrawals, succeeded
+    ):
+        group_ends = dict(
+            zip(group_starts.tolist(), np.r_[group_starts[1:], len(deltas)].tolist())
+        )
+        for start in starts.tolist():
+            end = group_ends[start]
+            balance = int(initial_balances[start])
+            results = []
+            for delta, withdrawal in zip(
+                deltas[start:end].tolist(), withdrawals[start:end].tolist()
+            ):
+                ok = not withdrawal or balance + delta >= BankAccount.OVERDRAFT_LIMIT
+                if ok:
+                    balance += delta
+                results.append(ok)
+            succeeded[start:end] = results
+
+
+# Runs `BankAccountCommand`s on `BankAccount` objects through a batch and writes back the balances and
+# the `success` flags, just as if every command had been invoked in order.
+def invoke_batch(commands: List[BankAccountCommand]):
+    index = {}
+    accounts = []
+    for command in commands:
+        if id(command.account) not in index:
+            index[id(command.account)] = len(accounts)
+            accounts.append(command.account)
+
+    batch = BankAccountBatch([account.balance for account in accounts])
+    success = batch.apply(
+        [index[id(command.account)] for command in commands],
+        [command.action.value for command in commands],
+        [command.amount for command in commands],
+    )
+    for account, balance in zip(accounts, batch.balances.tolist()):
+        account.balance = balance
+    for command, succeeded in zip(commands, success.tolist()):
+        command.success = succeeded
+
+
+def random_commands(account_count: int, command_count: int, seed: int = 0):
+    generator = np.random.default_rng(seed)
+    accounts = generator.integers(0, account_count, command_count)
+    actions = generator.choice([DEPOSIT, WITHDRAW], command_count)
+    amounts = generator.integers(1, 400, command_count)
+    return accounts, actions, amounts
+
+
+def benchmark_batch(account_count: int = 100_000, command_count: int = 1_000_000):
+    accounts, actions, amounts = random_commands(account_count, command_count)
+    batch = BankAccountBatch(np.zeros(account_count))
+    start = time.perf_counter()
+    success = batch.apply(accounts, actions, amounts)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{command_count} commands on {account_count} accounts in {elapsed:.2f}s, "
+        f"{(~success).sum()} rejected"
+    )
+
+
+class TestSuite(unittest.TestCase):
+    def test_matches_sequential_invoke(self):
+        accounts, actions, amounts = random_commands(20, 2000, seed=42)
+        sequential = [
+            BankAccount(random.Random(i).randint(-500, 500)) for i in range(20)
+        ]
+        batched = [BankAccount(account.balance) for account in sequential]
+
+        sequential_commands = [
+            BankAccountCommand(sequential[a], BankAccountCommand.Action(c), m)
+            for a, c, m in zip(accounts.tolist(), actions.tolist(), amounts.tolist())
+        ]
+        batched_commands = [
+            BankAccountCommand(batched[a], BankAccountCommand.Action(c), m)
+            for a, c, m in zip(accounts.tolist(), actions.tolist(), amounts.tolist())
+        ]
+        for command in sequential_commands:
+            command.invoke()
+        invoke_batch(batched_commands)
+
+        self.assertEqual(
+            [account.balance for account in sequential],
+            [account.balance for account in batched],
+        )
+        self.assertEqual(
+            [command.success for command in sequential_commands],
+            [command.success for command in batched_commands],
+        )
+
+    def test_overdraft_rejection(self):
+        batch = BankAccountBatch([0, 100])
+        success = batch.apply(
+            [0, 0, 1, 0], [WITHDRAW, WITHDRAW, WITHDRAW, DEPOSIT], [400, 200, 700, 50]
+        )
+        self.assertEqual(success.tolist(), [True, False, False, True])
+        self.assertEqual(batch.balances.tolist(), [-350, 100])
+
+    def test_without_rounds(self):
+        for max_rounds in (0, 1):
+            batch = BankAccountBatch([0, 100, 5], max_rounds=max_rounds)
+            success = batch.apply(
+                [0, 0, 1, 0, 2],
+                [WITHDRAW, WITHDRAW, WITHDRAW, DEPOSIT, DEPOSIT],
+                [400, 200, 700, 50, 1],
+            )
+            self.assertEqual(success.tolist(), [True, False, False, True, True])
+            self.assertEqual(batch.balances.tolist(), [-350, 100, 6])
+
+    def test_many_rejections_on_one_account(self):
+        count = 30_000
+        batch = BankAccountBatch([-500, 0])
+        accounts = np.zeros(count, dtype=np.int64)
+        accounts[::1000] = 1
+        actions = np.full(count, WITHDRAW)
+        actions[5001] = DEPOSIT
+        amounts = np.ones(count, dtype=np.int64)
+        amounts[5001] = 3
+        start = time.perf_counter()
+        success = batch.apply(accounts, actions, amounts)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        # Only the three withdrawals after the deposit succeed on account 0.
+        self.assertEqual(int(success[accounts == 0].sum()), 1 + 3)
+        self.assertEqual(int(success[accounts == 1].sum()), 30)
+        self.assertEqual(batch.balances.tolist(), [-500, -30])
+
+
+if __name__ == "__main__":
+    benchmark_batch()
+    unittest.main()
@@ -5,7 +5,9 @@
 # seperate lexical tokens (lexin). Then it tries to interpretes the tokens (parsing).
 from __future__ import annotations
 from enum import Enum, auto
+import sys
 from typing import List, Union
+import time
 
 
 class Token:
@@ -86,32 +88,59 @@ class BinaryExpression:
             return self.left.value - self.right.value
 
 
+# The parser makes a single pass over the tokens. Finished sub-expressions are kept on an operand
+# stack and pending operators and open parentheses on an operator stack. As `+` and `-` have the same
+# precedence and are left-associative, an operator can be combined with its operands as soon as the
+# next operator or closing parenthesis arrives. Using explicit stacks instead of recursion means that
+# arbitrarily deep nesting works and the whole parse takes O(n) time and memory.
+_binary_types = {
+    Token.Type.PLUS: BinaryExpression.Type.ADDITION,
+    Token.Type.MINUS: BinaryExpression.Type.SUBTRACTION,
+}
+
+
 def parse(tokens: List[Token]):
-    result = BinaryExpression()
-    idx = 0
-    while idx < len(tokens):
-        token = tokens[idx]
+    operands = []
+    operators = []
+
+    def reduce():
+        if len(operands) < 2:
+            raise ValueError("Missing operand for binary expression")
+        right = operands.pop()
+        left = operands.pop()
+        expression = BinaryExpression()
+        expression.type = _binary_types[operators.pop()]
+        expression.add(left)
+        expression.add(right)
+        operands.append(expression)
+
+    for token in tokens:
         if token.type == Token.Type.INTEGER:
-            result.add(Integer(int(token.text)))
-
-        elif token.type == Token.Type.PLUS:
-            result.type = BinaryExpression.Type.ADDITION
+            operands.append(Integer(int(token.text)))
 
-        elif token.type == Token.Type.MINUS:
-            result.type = BinaryExpression.Type.SUBTRACTION
+        elif token.type == Token.Type.PLUS or token.type == Token.Type.MINUS:
+            while operators and operators[-1] != Token.Type.LPARENTH:
+                reduce()
+            operators.append(token.type)
 
         elif token.type == Token.Type.LPARENTH:
-            j = idx
-            while j < len(tokens):
-                if tokens[j].type == Token.Type.RPARENTH:
-                    break
-                else:
-                    j += 1
-            subexpression = tokens[idx + 1 : j]
-            result.add(parse(subexpression))
-            idx = j
-        idx += 1
-    return result
+            operators.append(token.type)
+
+        elif token.type == Token.Type.RPARENTH:
+            while operators and operators[-1] != Token.Type.LPARENTH:
+                reduce()
+            if not operators:
+                raise ValueError("Unmatched `)`")
+            operators.pop()
+
+    while operators:
+        if operators[-1] == Token.Type.LPARENTH:
+            raise ValueError("Unmatched `(`")
+        reduce()
+
+    if len(operands) != 1:
+        raise ValueError("Expression does not reduce to a single value")
+    return operands[0]
 
 
 def calc(text: str):
@@ -120,5 +149,26 @@ def calc(text: str):
     print(f"value: {parsed_tokens.value}")
 
 
+# Parsing time should grow linearly with the number of tokens, for flat and for deeply nested input.
+def benchmark_parse(sizes=(10_000, 100_000, 1_000_000)):
+    for size in sizes:
+        flat = "+".join(["1"] * (size // 2))
+        nested = "(" * (size // 4) + "1" + "+1)" * (size // 4)
+        for name, text in (("flat", flat), ("nested", nested)):
+            tokens = lex(text)
+            start = time.perf_counter()
+            parse(tokens)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>6} {len(tokens):>9} tokens: {elapsed:.3f}s "
+                f"({elapsed / len(tokens) * 1e9:.0f} ns/token)"
+            )
+
+
 if __name__ == "__main__":
-    calc("(13+4)-(12+1)")
\ No newline at end of file
+    calc("(13+4)-(12+1)")
+    assert parse(lex("((1+2)+3)")).value == 6
+    assert parse(lex("10-(2-(3-1))-4")).value == 6
+    # The benchmark takes a few seconds, so it only runs on request.
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_parse()
\ No newline at end of file
@@ -1,6 +1,8 @@
 from __future__ import annotations
 from enum import Enum, auto
-from typing import List, Type, Union, Dict
+from typing import List, Optional, Type, Union, Dict
+
+import numpy as np
 
 
 class Token:
@@ -8,6 +10,7 @@ class Token:
         INTEGER = auto()
         PLUS = auto()
         MINUS = auto()
+        VARIABLE = auto()
 
     def __init__(self, type: Type, text: str):
         self.type = type
@@ -21,6 +24,19 @@ class Integer:
     def __init__(self, value: int):
         self.value = value
 
+    def evaluate(self, variables: Dict[str, int]):
+        return self.value
+
+
+# A variable that is only looked up when the expression is evaluated. This lets us parse an
+# expression once and evaluate it against many different variable bindings.
+class Variable:
+    def __init__(self, name: str):
+        self.name = name
+
+    def evaluate(self, variables: Dict[str, int]):
+        return variables[self.name]
+
 
 class BinaryExpression:
     class Type(Enum):
@@ -55,6 +71,13 @@ class BinaryExpression:
         elif self.type == self.Type.SUBTRACTION:
             return self.left.value - self.right.value
 
+    def evaluate(self, variables: Dict[str, int]):
+        if self.type == self.Type.ADDITION:
+            return self.left.evaluate(variables) + self.right.evaluate(variables)
+
+        elif self.type == self.Type.SUBTRACTION:
+            return self.left.evaluate(variables) - self.right.evaluate(variables)
+
 
 def parse(tokens: List[Token]):
     result = BinaryExpression()
@@ -85,8 +108,41 @@ class ExpressionProcessor:
         else:
             return ExpressionProcessor.parse(tokens).value
 
+    # Evaluates `expression` once for every row of `columns`, which maps variable names to equally
+    # long arrays. All rows are computed at once with array arithmetic. Scalars in `self.variables`
+    # are broadcast to every row, and an unknown variable makes every row zero, like `calculate`.
+    def calculate_many(self, expression: str, columns: Dict[str, np.ndarray]):
+        columns = {name: np.asarray(column) for name, column in columns.items()}
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All columns must have the same length, got {lengths}")
+        length = lengths.pop() if lengths else 1
+
+        try:
+            result = ExpressionProcessor.compile(expression).evaluate(
+                {**self.variables, **columns}
+            )
+        except KeyError:
+            result = 0
+
+        if np.ndim(result) == 0:
+            return np.full(length, result)
+        return result
+
+    # Lexes and parses `expression` without looking up any variables, so the resulting tree can be
+    # evaluated many times with `evaluate(variables)`. Raises a `KeyError` on evaluation if a
+    # variable is unknown.
+    @staticmethod
+    def compile(expression: str):
+        tokens = ExpressionProcessor.lex(expression)
+        if len(tokens) == 0:
+            return Integer(0)
+        else:
+            return ExpressionProcessor.parse(tokens)
+
+    # If `variables` is None, variables are kept as `VARIABLE` tokens instead of being substituted.
     @staticmethod
-    def lex(text: str, variables: Dict[str, int]):
+    def lex(text: str, variables: Optional[Dict[str, int]] = None):
         result = []
         idx = 0
         while idx < len(text):
@@ -114,9 +170,10 @@ class ExpressionProcessor:
                     else:
                         break
                 variable = "".join(variable)
-                if variable in variables:
+                if variables is None:
+                    result.append(Token(Token.Type.VARIABLE, variable))
+                elif variable in variables:
                     result.append(Token(Token.Type.INTEGER, variables[variable]))
-                    break
                 else:
                     return []
             else:
@@ -134,6 +191,9 @@ class ExpressionProcessor:
             if token.type == Token.Type.INTEGER:
                 result.add_int(Integer(int(token.text)))
 
+            elif token.type == Token.Type.VARIABLE:
+                result.add_int(Variable(token.text))
+
             elif token.type == Token.Type.PLUS:
                 result = result.add_type(BinaryExpression.Type.ADDITION)
 
@@ -141,6 +201,10 @@ class ExpressionProcessor:
                 result = result.add_type(BinaryExpression.Type.SUBTRACTION)
 
             idx += 1
+
+        # A single operand without any operator.
+        if result.type is None:
+            return result.left
         return result
 
 
@@ -155,3 +219,14 @@ if __name__ == "__main__":
     processor = ExpressionProcessor()
     processor.variables = {"x": 3}
     assert processor.calculate("10-2-x") == 5
+    assert processor.calculate("x+1") == 4
+    assert processor.calculate("7") == 7
+
+    compiled = ExpressionProcessor.compile("10-2-x")
+    assert compiled.evaluate({"x": 3}) == 5
+    assert compiled.evaluate({"x": 8}) == 0
+
+    processor.variables = {"y": 1}
+    x = np.arange(5)
+    assert list(processor.calculate_many("10-x-y", {"x": x})) == [9, 8, 7, 6, 5]
+    assert list(processor.calculate_many("10-z", {"x": x})) == [0, 0, 0, 0, 0]
@@ -0,0 +1,78 @@
+# Caching compiled expressions.
+# Lexing and parsing an expression is much more expensive than evaluating the resulting tree. If the
+# same expressions are calculated over and over again with different variables, we can keep the
+# parsed trees around and only bind the variables when we evaluate them.
+from __future__ import annotations
+from collections import OrderedDict
+
+from python_design_patterns.interpreter.ex import ExpressionProcessor
+
+
+# A bounded least-recently-used cache from expression text to its compiled tree.
+class ExpressionCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._expressions = OrderedDict()
+
+    def get(self, expression: str):
+        try:
+            compiled = self._expressions[expression]
+        except KeyError:
+            self.misses += 1
+            compiled = ExpressionProcessor.compile(expression)
+            if self.maxsize > 0:
+                self._expressions[expression] = compiled
+                if len(self._expressions) > self.maxsize:
+                    self._expressions.popitem(last=False)
+                    self.evictions += 1
+        else:
+            self.hits += 1
+            self._expressions.move_to_end(expression)
+        return compiled
+
+    def clear(self):
+        self._expressions.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._expressions)
+
+    def __str__(self):
+        return (
+            f"ExpressionCache(size={len(self)}/{self.maxsize}, hits={self.hits}, "
+            f"misses={self.misses}, evictions={self.evictions})"
+        )
+
+
+class CachingExpressionProcessor(ExpressionProcessor):
+    def __init__(self, cache_size: int = 1024):
+        super().__init__()
+        self.cache = ExpressionCache(maxsize=cache_size)
+
+    def calculate(self, expression: str):
+        compiled = self.cache.get(expression)
+        try:
+            return compiled.evaluate(self.variables)
+        except KeyError:
+            # Same as `ExpressionProcessor.calculate`: unknown variables evaluate to zero.
+            return 0
+
+
+if __name__ == "__main__":
+    processor = CachingExpressionProcessor(cache_size=2)
+    processor.variables = {"x": 3}
+    assert processor.calculate("10-2-x") == 5
+
+    processor.variables = {"x": 4}
+    assert processor.calculate("10-2-x") == 4
+    assert processor.cache.hits == 1 and processor.cache.misses == 1
+
+    assert processor.calculate("1+2+xy") == 0
+    assert processor.calculate("1+2+3") == 6
+    assert processor.cache.evictions == 1
+    print(processor.cache)
@@ -0,0 +1,98 @@
+# Compiling expression trees into Python functions.
+# Evaluating a parsed tree visits every node: a property lookup, an Enum comparison and a recursive
+# call per operator. As the tree does not change between evaluations, we can instead translate it
+# once into Python source and let Python compile it into a single function. Evaluating the
+# expression then costs exactly one function call.
+# This works for the trees of `Interpreter.py` as well as of `ex.py`, as both use `Integer` leaves
+# and `BinaryExpression` nodes with `ADDITION` and `SUBTRACTION` types; `ex.py` adds `Variable`s.
+from __future__ import annotations
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+_operators = {"ADDITION": "+", "SUBTRACTION": "-"}
+
+
+# Returns the statements and the expression computing the value of the tree. Like
+# `iterative_evaluator.evaluate`, the tree is walked with an explicit stack, as the left-deep chains
+# `ExpressionProcessor.parse` creates for `a+b+c+...` would exceed the recursion limit. Python's
+# compiler recurses as well, so every subexpression nested deeper than `max_depth` is assigned to a
+# temporary variable in a statement of its own.
+def to_source(tree, max_depth: int = 100) -> Tuple[List[str], str]:
+    statements = []
+    # Pairs of the source of an operand and how deeply it is nested.
+    values = []
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, tuple):
+            operator, parenthesize = item
+            right, right_depth = values.pop()
+            left, left_depth = values.pop()
+            # `+` and `-` are left-associative, so only the right operand needs parentheses.
+            if parenthesize:
+                right = f"({right})"
+            source = f"{left} {operator} {right}"
+            depth = max(left_depth, right_depth) + 1
+            if depth > max_depth:
+                name = f"_t{len(statements)}"
+                statements.append(f"{name} = {source}")
+                source, depth = name, 0
+            values.append((source, depth))
+        elif hasattr(item, "left"):
+            stack.append((_operators[item.type.name], hasattr(item.right, "left")))
+            # The left operand is popped, and therefore translated, first.
+            stack.append(item.right)
+            stack.append(item.left)
+        elif hasattr(item, "name"):
+            # Variables are looked up in the `variables` argument of the compiled function.
+            values.append((f"variables[{item.name!r}]", 0))
+        else:
+            values.append((repr(item.value), 0))
+    return statements, values.pop()[0]
+
+
+def compile_tree(tree) -> Callable[[Optional[Dict[str, int]]], int]:
+    statements, expression = to_source(tree)
+    body = "".join(f"    {statement}\n" for statement in statements)
+    source = f"def _expression(variables=None):\n{body}    return {expression}\n"
+    namespace = {}
+    exec(compile(source, "<expression>", "exec"), namespace)
+    return namespace["_expression"]
+
+
+def benchmark_compiled(number: int = 100_000):
+    from python_design_patterns.interpreter.ex import ExpressionProcessor
+
+    expression = "-".join(["1+x+23-y"] * 8)
+    variables = {"x": 3, "y": 5}
+    tree = ExpressionProcessor.compile(expression)
+    compiled = compile_tree(tree)
+    assert compiled(variables) == tree.evaluate(variables)
+
+    tree_time = timeit.timeit(lambda: tree.evaluate(variables), number=number)
+    compiled_time = timeit.timeit(lambda: compiled(variables), number=number)
+    print(
+        f"tree walking: {tree_time / number * 1e6:.2f}us, "
+        f"compiled: {compiled_time / number * 1e6:.2f}us, "
+        f"speedup: {tree_time / compiled_time:.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    from python_design_patterns.interpreter import Interpreter
+    from python_design_patterns.interpreter.ex import ExpressionProcessor
+
+    tree = Interpreter.parse(Interpreter.lex("(13+4)-(12+1)"))
+    assert compile_tree(tree)() == tree.value == 4
+
+    tree = ExpressionProcessor.compile("10-2-x")
+    assert compile_tree(tree)({"x": 3}) == 5
+
+    for terms in (1000, 3000, 10_000):
+        tree = ExpressionProcessor.compile("+".join(["x"] * terms))
+        assert compile_tree(tree)({"x": 2}) == 2 * terms
+        # Right-deep: 1-(1-(1-...)).
+        tree = Interpreter.parse(Interpreter.lex("1-(" * terms + "1" + ")" * terms))
+        assert compile_tree(tree)() == (terms + 1) % 2
+
+    benchmark_compiled()
@@ -0,0 +1,182 @@
+# Sharing common sub-expressions between formulas.
+# If many formulas contain the same sub-expression, every parsed tree holds its own copy and every
+# evaluation computes it again. Like a flyweight, we can keep a table of all distinct nodes and reuse
+# a node whenever a structurally identical one is parsed again (hash-consing). The trees of all
+# formulas then form one directed acyclic graph. Sub-expressions made of literals only are folded into
+# a single `Integer` on the way.
+from __future__ import annotations
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from python_design_patterns.interpreter.ex import (
+    BinaryExpression,
+    ExpressionProcessor,
+    Integer,
+    Token,
+    Variable,
+)
+
+# Marks sub-expressions referencing a variable that is not defined.
+_UNKNOWN = object()
+
+
+class ExpressionDAG:
+    def __init__(self):
+        self._nodes = {}
+
+    # Returns the shared node structurally identical to `tree`. `tree` can come from
+    # `Interpreter.py` or `ex.py`, the result is always made of the node types of `ex.py`.
+    def intern(self, tree):
+        interned = {}
+        stack = [tree]
+        while stack:
+            node = stack[-1]
+            if id(node) in interned:
+                stack.pop()
+            elif hasattr(node, "left"):
+                if id(node.left) not in interned:
+                    stack.append(node.left)
+                elif id(node.right) not in interned:
+                    stack.append(node.right)
+                else:
+                    stack.pop()
+                    interned[id(node)] = self._binary(
+                        BinaryExpression.Type[node.type.name],
+                        interned[id(node.left)],
+                        interned[id(node.right)],
+                    )
+            elif hasattr(node, "name"):
+                stack.pop()
+                interned[id(node)] = self._get_or_add(
+                    ("variable", node.name), Variable, node.name
+                )
+            else:
+                stack.pop()
+                interned[id(node)] = self._integer(node.value)
+        return interned[id(tree)]
+
+    def parse(self, tokens: List[Token]):
+        return self.intern(ExpressionProcessor.parse(tokens))
+
+    def compile(self, expression: str):
+        return self.intern(ExpressionProcessor.compile(expression))
+
+    # Evaluates all `roots` against one set of variables. Every shared node is computed only once.
+    def evaluate_many(self, roots, variables: Optional[Dict[str, int]] = None):
+        values = {}
+        for root in roots:
+            stack = [root]
+            while stack:
+                node = stack[-1]
+                if id(node) in values:
+                    stack.pop()
+                elif isinstance(node, BinaryExpression):
+                    left = values.get(id(node.left), None)
+                    right = values.get(id(node.right), None)
+                    if left is None:
+                        stack.append(node.left)
+                    elif right is None:
+                        stack.append(node.right)
+                    else:
+                        stack.pop()
+                        if left is _UNKNOWN or right is _UNKNOWN:
+                            values[id(node)] = _UNKNOWN
+                        elif node.type is BinaryExpression.Type.ADDITION:
+                            values[id(node)] = left + right
+                        else:
+                            values[id(node)] = left - right
+                elif isinstance(node, Variable):
+                    stack.pop()
+                    values[id(node)] = (variables or {}).get(node.name, _UNKNOWN)
+                else:
+                    stack.pop()
+                    values[id(node)] = node.value
+
+        # Like `ExpressionProcessor.calculate`, unknown variables evaluate to zero.
+        return [
+            0 if values[id(root)] is _UNKNOWN else values[id(root)] for root in roots
+        ]
+
+    def _integer(self, value: int):
+        return self._get_or_add(("integer", value), Integer, value)
+
+    def _binary(self, type: BinaryExpression.Type, left, right):
+        if isinstance(left, Integer) and isinstance(right, Integer):
+            if type is BinaryExpression.Type.ADDITION:
+                return self._integer(left.value + right.value)
+            else:
+                return self._integer(left.value - right.value)
+        # The children are already shared, so their identities describe their structure.
+        return self._get_or_add(
+            (type, id(left), id(right)), BinaryExpression, type, left, right
+        )
+
+    def _get_or_add(self, key, node_class, *args):
+        node = self._nodes.get(key, None)
+        if node is None:
+            node = node_class(*args)
+            self._nodes[key] = node
+        return node
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+def count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if hasattr(node, "left"):
+            stack.append(node.left)
+            stack.append(node.right)
+    return count
+
+
+def benchmark_dag(formula_count: int = 1000, shared_terms: int = 50):
+    shared = "+".join(f"a{chr(97 + i % 26)}" for i in range(shared_terms))
+    expressions = [f"{shared}-{i}+1+x" for i in range(formula_count)]
+    variables = {f"a{chr(97 + i)}": i for i in range(26)}
+    variables["x"] = 7
+
+    tracemalloc.start()
+    trees = [ExpressionProcessor.compile(expression) for expression in expressions]
+    tree_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    dag = ExpressionDAG()
+    roots = [dag.compile(expression) for expression in expressions]
+    dag_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    tree_values = [tree.evaluate(variables) for tree in trees]
+    tree_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dag_values = dag.evaluate_many(roots, variables)
+    dag_time = time.perf_counter() - start
+
+    assert tree_values == dag_values
+    print(
+        f"trees: {sum(count_nodes(tree) for tree in trees)} nodes, "
+        f"{tree_memory / 1e6:.1f}MB, evaluated in {tree_time * 1e3:.1f}ms"
+    )
+    print(
+        f"  dag: {len(dag)} nodes, {dag_memory / 1e6:.1f}MB, "
+        f"evaluated in {dag_time * 1e3:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    dag = ExpressionDAG()
+    first = dag.compile("x+y+1+2")
+    second = dag.compile("x+y+1-z")
+    assert first.left.left is second.left.left
+    assert dag.compile("1+2+3").value == 6
+    assert dag.evaluate_many([first, second], {"x": 1, "y": 2}) == [6, 0]
+
+    benchmark_dag()
@@ -0,0 +1,125 @@
+# Recomputing only the formulas that depend on a changed variable.
+# If thousands of formulas are registered and one variable changes, recomputing all of them wastes
+# time on formulas that do not even use this variable. We therefore keep an index from every variable
+# to the formulas referencing it. Changing a variable recomputes only those formulas and notifies
+# observers about every formula whose value changed.
+from __future__ import annotations
+from collections import defaultdict
+from functools import partial
+from typing import Dict, Iterable, Set
+
+from python_design_patterns.interpreter.ex import ExpressionProcessor
+from python_design_patterns.interpreter.expression_compiler import compile_tree
+from python_design_patterns.interpreter.iterative_evaluator import evaluate
+
+
+class Event(list):
+    def __call__(self, *args, **kwargs):
+        for fun in self:
+            fun(*args, **kwargs)
+
+
+def variable_names(tree) -> Set[str]:
+    names = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if hasattr(node, "left"):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif hasattr(node, "name"):
+            names.add(node.name)
+    return names
+
+
+class FormulaRegistry:
+    def __init__(self):
+        # Only change variables through `set_variable` and `update_variables`, otherwise the
+        # formulas are not recomputed.
+        self.variables = {}
+        self.values = {}
+        self.formula_changed = Event()
+        self._formulas = {}
+        self._references = {}
+        self._dependents = defaultdict(set)
+
+    def register(self, name: str, expression: str):
+        if name in self._formulas:
+            self.unregister(name)
+        tree = ExpressionProcessor.compile(expression)
+        try:
+            self._formulas[name] = compile_tree(tree)
+        except (RecursionError, MemoryError):
+            # Too large for Python's compiler, evaluate the tree itself instead.
+            self._formulas[name] = partial(evaluate, tree)
+        self._references[name] = variable_names(tree)
+        for variable in self._references[name]:
+            self._dependents[variable].add(name)
+        self.values[name] = self._evaluate(name)
+        return self.values[name]
+
+    def unregister(self, name: str):
+        for variable in self._references.pop(name):
+            self._dependents[variable].discard(name)
+            if not self._dependents[variable]:
+                del self._dependents[variable]
+        del self._formulas[name]
+        del self.values[name]
+
+    def set_variable(self, name: str, value: int):
+        self.update_variables({name: value})
+
+    def update_variables(self, variables: Dict[str, int]):
+        affected = set()
+        for name, value in variables.items():
+            if name not in self.variables or self.variables[name] != value:
+                self.variables[name] = value
+                affected.update(self._dependents.get(name, ()))
+        self._recompute(affected)
+
+    def remove_variable(self, name: str):
+        if name in self.variables:
+            del self.variables[name]
+            self._recompute(self._dependents.get(name, ()))
+
+    def _recompute(self, names: Iterable[str]):
+        for name in names:
+            value = self._evaluate(name)
+            if value != self.values[name]:
+                self.values[name] = value
+                self.formula_changed(name, value)
+
+    def _evaluate(self, name: str):
+        try:
+            return self._formulas[name](self.variables)
+        except KeyError:
+            # Like `ExpressionProcessor.calculate`, unknown variables evaluate to zero.
+            return 0
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+    def __len__(self):
+        return len(self._formulas)
+
+
+if __name__ == "__main__":
+    registry = FormulaRegistry()
+    changes = []
+    registry.formula_changed.append(lambda name, value: changes.append((name, value)))
+
+    registry.update_variables({"x": 1, "y": 2})
+    registry.register("total", "x+y+10")
+    registry.register("difference", "x-y")
+    registry.register("only_z", "z+1")
+    assert registry["total"] == 13 and registry["only_z"] == 0
+
+    registry.set_variable("x", 5)
+    assert sorted(changes) == [("difference", 3), ("total", 17)]
+
+    changes.clear()
+    registry.set_variable("z", 1)
+    assert changes == [("only_z", 2)]
+
+    registry.register("long", "+".join(["x"] * 2000))
+    assert registry["long"] == 2000 * 5
@@ -0,0 +1,72 @@
+# Evaluating deep expression trees without recursion.
+# `ExpressionProcessor.parse` turns `1+2+3+...` into a left-deep chain of `BinaryExpression`s, and
+# `value` recurses once per operator. With a few thousand terms this exceeds Python's recursion limit.
+# Instead, we can walk the tree in post-order with an explicit stack: operands are pushed onto a value
+# stack and every operator combines the two values on top of it.
+from __future__ import annotations
+import time
+from typing import Dict, Optional
+
+# Markers for operators whose operands are being evaluated.
+_ADDITION = object()
+_SUBTRACTION = object()
+
+
+def evaluate(tree, variables: Optional[Dict[str, int]] = None):
+    values = []
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if item is _ADDITION:
+            right = values.pop()
+            values[-1] = values[-1] + right
+        elif item is _SUBTRACTION:
+            right = values.pop()
+            values[-1] = values[-1] - right
+        elif hasattr(item, "left"):
+            if item.type is item.Type.ADDITION:
+                stack.append(_ADDITION)
+            else:
+                stack.append(_SUBTRACTION)
+            # The left operand is popped, and therefore evaluated, first.
+            stack.append(item.right)
+            stack.append(item.left)
+        elif hasattr(item, "name"):
+            values.append(variables[item.name])
+        else:
+            values.append(item.value)
+    return values.pop()
+
+
+def benchmark_evaluate(total_nodes: int = 1_000_000):
+    from python_design_patterns.interpreter.ex import ExpressionProcessor
+
+    for terms in (500, 10_000, 1_000_000):
+        tree = ExpressionProcessor.compile("+".join(["1"] * terms))
+        repetitions = max(1, total_nodes // terms)
+        for name, evaluator in (
+            ("recursive", lambda: tree.value),
+            ("iterative", lambda: evaluate(tree)),
+        ):
+            start = time.perf_counter()
+            try:
+                for _ in range(repetitions):
+                    assert evaluator() == terms
+            except RecursionError:
+                print(f"{name:>9} {terms:>9} terms: RecursionError")
+                continue
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>9} {terms:>9} terms: "
+                f"{terms * repetitions / elapsed / 1e6:.2f}M terms/s"
+            )
+
+
+if __name__ == "__main__":
+    from python_design_patterns.interpreter import Interpreter
+    from python_design_patterns.interpreter.ex import ExpressionProcessor
+
+    assert evaluate(Interpreter.parse(Interpreter.lex("(13+4)-(12+1)"))) == 4
+    assert evaluate(ExpressionProcessor.compile("10-2-x"), {"x": 3}) == 5
+
+    benchmark_evaluate()
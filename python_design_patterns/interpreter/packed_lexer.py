@@ -0,0 +1,110 @@
+# A packed token stream.
+# Both lexers create a `Token` object for every token they find. For large inputs, those objects
+# cost much more memory than the text itself. Instead, we can store the tokens in parallel arrays:
+# one byte for the token type and two integers pointing at the token's text in the source.
+from __future__ import annotations
+from array import array
+import re
+import time
+import tracemalloc
+
+INTEGER = 1
+PLUS = 2
+MINUS = 3
+LPARENTH = 4
+RPARENTH = 5
+VARIABLE = 6
+_WHITESPACE = 7
+_INVALID = 8
+
+# Each group of the pattern corresponds to one type code above.
+_token_pattern = re.compile(
+    r"(\d+)|(\+)|(-)|(\()|(\))|([^\W\d_]+)|(\s+)|(.)", re.DOTALL
+)
+
+TYPE_NAMES = {
+    INTEGER: "INTEGER",
+    PLUS: "PLUS",
+    MINUS: "MINUS",
+    LPARENTH: "LPARENTH",
+    RPARENTH: "RPARENTH",
+    VARIABLE: "VARIABLE",
+}
+
+
+class PackedTokens:
+    def __init__(self, text: str):
+        self.text = text
+        self.types = array("b")
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def __len__(self):
+        return len(self.types)
+
+    def token_text(self, idx: int):
+        return self.text[self.starts[idx] : self.ends[idx]]
+
+    def integer(self, idx: int):
+        return int(self.text[self.starts[idx] : self.ends[idx]])
+
+    # Converts the packed tokens back into `Token` objects of the given class one at a time, so
+    # they can be passed to the existing parsers.
+    def iter_tokens(self, token_class):
+        for idx in range(len(self.types)):
+            yield token_class(
+                token_class.Type[TYPE_NAMES[self.types[idx]]], self.token_text(idx)
+            )
+
+
+def lex_packed(text: str):
+    tokens = PackedTokens(text)
+    types = tokens.types
+    starts = tokens.starts
+    ends = tokens.ends
+    for match in _token_pattern.finditer(text):
+        code = match.lastindex
+        if code == _WHITESPACE:
+            continue
+        if code == _INVALID:
+            raise ValueError(
+                f"Cannot parse {match.group()} at position {match.start()}"
+            )
+        start, end = match.span()
+        types.append(code)
+        starts.append(start)
+        ends.append(end)
+    return tokens
+
+
+def benchmark_lex(size: int = 1_000_000):
+    from python_design_patterns.interpreter.Interpreter import lex
+
+    text = "+".join(f"({i}-{i + 1})" for i in range(size // 10))[:size]
+    text = text[: text.rfind(")") + 1]
+    for name, lexer in (("objects", lex), ("packed", lex_packed)):
+        start = time.perf_counter()
+        tokens = lexer(text)
+        elapsed = time.perf_counter() - start
+        del tokens
+
+        tracemalloc.start()
+        tokens = lexer(text)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:>7}: {len(tokens)} tokens from {len(text) / 1e6:.1f}MB "
+            f"in {elapsed:.2f}s, peak memory {peak / 1e6:.1f}MB"
+        )
+        del tokens
+
+
+if __name__ == "__main__":
+    from python_design_patterns.interpreter.Interpreter import Token, parse
+
+    tokens = lex_packed("(13+4)-(12+1)")
+    assert list(tokens.types) == [4, 1, 2, 1, 5, 3, 4, 1, 2, 1, 5]
+    assert tokens.integer(1) == 13
+    assert parse(list(tokens.iter_tokens(Token))).value == 4
+
+    benchmark_lex()
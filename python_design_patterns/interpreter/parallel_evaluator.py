@@ -0,0 +1,95 @@
+# Evaluating expressions on several cores.
+# Because of the GIL, a single Python process evaluates expressions on one core only. A process pool
+# lifts this limit. Every worker receives the variables once when it starts, and expressions are sent
+# to the workers in chunks, so the cost of pickling and inter-process communication is paid once per
+# chunk instead of once per expression.
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from python_design_patterns.interpreter.expression_cache import (
+    CachingExpressionProcessor,
+)
+
+# The processor of the current worker process, created by `_init_worker`.
+_processor = None
+
+
+def _init_worker(variables: Dict[str, int]):
+    global _processor
+    _processor = CachingExpressionProcessor()
+    _processor.variables = variables
+
+
+def _calculate_chunk(expressions: List[str]) -> List[int]:
+    return [_processor.calculate(expression) for expression in expressions]
+
+
+class ParallelExpressionProcessor:
+    def __init__(
+        self,
+        variables: Optional[Dict[str, int]] = None,
+        max_workers: Optional[int] = None,
+        chunk_size: int = 1000,
+    ):
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(variables or {},),
+        )
+
+    # Yields the results in the order of `expressions`. At most two chunks per worker are in flight,
+    # so `expressions` can be an arbitrarily long stream.
+    def calculate_all(self, expressions: Iterable[str]) -> Iterator[int]:
+        expressions = iter(expressions)
+        pending = deque()
+        while True:
+            while len(pending) < 2 * self.max_workers:
+                chunk = list(islice(expressions, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(self.executor.submit(_calculate_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+def benchmark_parallel(expression_count: int = 50_000):
+    expressions = [
+        "+".join(str(i + j) for j in range(20)) + "-x" for i in range(expression_count)
+    ]
+    baseline = None
+    for workers in range(1, os.cpu_count() + 1):
+        with ParallelExpressionProcessor({"x": 1}, max_workers=workers) as processor:
+            start = time.perf_counter()
+            results = list(processor.calculate_all(expressions))
+            elapsed = time.perf_counter() - start
+        assert len(results) == expression_count
+        baseline = baseline or elapsed
+        print(
+            f"{workers:>3} workers: {expression_count / elapsed:,.0f} expressions/s, "
+            f"speedup {baseline / elapsed:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    with ParallelExpressionProcessor({"x": 3}, chunk_size=2) as processor:
+        results = list(processor.calculate_all(["1+2", "10-2-x", "1+2+xy", "7", "x"]))
+    assert results == [3, 5, 0, 7, 3]
+
+    benchmark_parallel()
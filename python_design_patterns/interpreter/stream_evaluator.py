@@ -0,0 +1,114 @@
+# Evaluating expression files of any size.
+# `ExpressionProcessor.calculate` works on a single string in memory. To evaluate a file with one
+# expression per line, we chain generators: one reads the file chunk by chunk and splits it into
+# lines, the next evaluates one line at a time. Only a chunk and the current line are ever in memory.
+# Lines are evaluated with `iterative_evaluator.evaluate`, so a line can be as long as it likes. A single
+# bad line should not end a run over a huge file, so its result is written as `ERROR_MARKER`, which
+# keeps every result on the line of its expression, or left out with `--skip-errors`.
+from __future__ import annotations
+import argparse
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from python_design_patterns.interpreter.ex import ExpressionProcessor
+from python_design_patterns.interpreter.iterative_evaluator import evaluate
+
+ERROR_MARKER = "error"
+
+
+def iter_lines(file: TextIO, chunk_size: int = 1 << 20) -> Iterator[str]:
+    remainder = ""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split("\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+# Yields the result of every line, or None if it is not a valid expression. Just like `calculate`, an
+# expression with an unknown variable is 0.
+def evaluate_lines(
+    lines: Iterable[str], processor: Optional[ExpressionProcessor] = None
+) -> Iterator[Optional[int]]:
+    if processor is None:
+        processor = ExpressionProcessor()
+    for line in lines:
+        try:
+            yield evaluate(
+                ExpressionProcessor.compile(line.strip()), processor.variables
+            )
+        except KeyError:
+            yield 0
+        # Characters the lexer does not know raise a ValueError, and an operator missing an operand,
+        # like in `1+`, leaves a None in the tree.
+        except (ValueError, AttributeError):
+            yield None
+
+
+# Returns the number of bad lines.
+def evaluate_file(
+    input_path: str,
+    output_path: str,
+    variables: Optional[Dict[str, int]] = None,
+    chunk_size: int = 1 << 20,
+    skip_errors: bool = False,
+) -> int:
+    processor = ExpressionProcessor()
+    processor.variables = variables or {}
+    errors = 0
+    with open(input_path) as input_file, open(output_path, "w") as output_file:
+        for result in evaluate_lines(iter_lines(input_file, chunk_size), processor):
+            if result is None:
+                errors += 1
+                if skip_errors:
+                    continue
+                result = ERROR_MARKER
+            output_file.write(f"{result}\n")
+    return errors
+
+
+def parse_variable(text: str):
+    name, _, value = text.partition("=")
+    return name, int(value)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate a file with one expression per line."
+    )
+    parser.add_argument("input", help="file with one expression per line")
+    parser.add_argument("output", help="file to write one result per line to")
+    parser.add_argument(
+        "-v",
+        "--variable",
+        action="append",
+        default=[],
+        type=parse_variable,
+        metavar="NAME=VALUE",
+        help="variable available to the expressions, can be repeated",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    parser.add_argument(
+        "--skip-errors",
+        action="store_true",
+        help=f"leave out bad lines instead of writing '{ERROR_MARKER}' for them",
+    )
+    arguments = parser.parse_args(argv)
+
+    errors = evaluate_file(
+        arguments.input,
+        arguments.output,
+        variables=dict(arguments.variable),
+        chunk_size=arguments.chunk_size,
+        skip_errors=arguments.skip_errors,
+    )
+    if errors:
+        print(f"{errors} lines could not be evaluated", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()